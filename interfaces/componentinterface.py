@@ -1,13 +1,39 @@
 import abc
 from typing import Dict
 import random
+import sys
+
+
+def _intern(value):
+    return sys.intern(value) if value else None
 
 
 class ComponentBaseClass(abc.ABC):
 
+    # Components keep the fields they use from their sensor properties row, parsed, instead of the row itself.
+    # Component classes list their own fields in __slots__ as well so no instance carries a __dict__.
+    __slots__ = ('name', 'component_id', 'item_type', 'reader', 'pin', 'raw_units', 'output_units', 'min', 'max')
+
     def __init__(self, name: str, data: Dict):
-        self.name = name
-        self.data = data
+        self.name = sys.intern(name)
+        # Index in the component registry of the model, None until registered
+        self.component_id = None
+        self.item_type = _intern(data.get('item_type'))
+        self.reader = _intern(data.get('reader'))
+        self.pin = _intern(data.get('pin'))
+        self.raw_units = _intern(data.get('raw_units'))
+        self.output_units = _intern(data.get('output_units')) or 'IN-DIA'
+        self.min = self.parse_float(data.get('min'))
+        self.max = self.parse_float(data.get('max'))
+
+    '''
+        Numeric field of a sensor properties row, default for missing or empty fields
+    '''
+    @staticmethod
+    def parse_float(value, default=0.0) -> float:
+        if value is None or value == '':
+            return default
+        return float(value)
 
     def get_full_name(self) -> str:
         return self.name
@@ -1 +1,3 @@
 from .labjack import LabJack
+from .registermap import RegisterMap
+from .readersensors import ReaderSensors
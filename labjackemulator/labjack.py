@@ -1,13 +1,15 @@
-import pandas as pd
 from modbushandler import ModbusReceiver
 import modbushandler.modbusencoder as encoder
 import modbushandler.modbusdecoder as decoder
 from metecmodel import Model, StatisticsCollector
 from interfaces import ComponentBaseClass
-import re
+from .registermap import RegisterMap, RegisterInfo
+from .readersensors import ReaderSensors
 import socket
-from logger import Logger
+from logger import Logger, Lazy
 import random
+import logging
+from array import array
 
 
 class LabJack:
@@ -16,58 +18,35 @@ class LabJack:
     # They only use holding register protocols
     DEVICE_FUNCTION_CODES = [3, 4, 6, 16]
     ENDIANNESS = 'BIG'
+    MAX_PLANS = 4096
 
     def __init__(self, name, pins_to_registers_file, sensor_properties_file, physical_model, port,
-                 localhost=True, socket_type=socket.SOCK_STREAM, noise_factor=0, failures={}):
-        self.pins = pd.read_csv(pins_to_registers_file).set_index('start_address')
-        self.pins['data'] = 0
-        self.pins.loc['pin' == 'HARDWARE_VERSION', 'data'] = 1.35
+                 localhost=True, socket_type=socket.SOCK_STREAM, noise_factor=0, failures={}, max_connections=5,
+                 idle_timeout=None):
+        # The modbus map and sensor properties are parsed once and shared by every labjack
+        self.register_map = RegisterMap.load(pins_to_registers_file)
         # Only get sensors for this labjack reader
-        self.sensors = pd.read_csv(sensor_properties_file).set_index('reader').loc[name]
+        self.sensors = ReaderSensors.get(sensor_properties_file, name)
+        # Values of registers without a component, e.g. device config and EF state, one slot per address
+        self.register_data = array('d', bytes(8 * len(self.register_map)))
+        self._set_register('HARDWARE_VERSION', 1.35)
         self.name = name
         self.model = physical_model
         self.failures = failures
         self.receiver = ModbusReceiver(port, localhost=localhost, device_function_codes=self.DEVICE_FUNCTION_CODES,
-                                       socket_type=socket_type, failures=self.failures)
+                                       socket_type=socket_type, failures=self.failures,
+                                       max_connections=max_connections, idle_timeout=idle_timeout)
         self.logger = Logger('LabjackLogger-{}'.format(port), '../logger/logs/labjack_log.txt')
         self.port = port
-        self.logger.info('Labjack created at port {}'.format(port))
+        self.logger.info('Labjack created at port {}', port)
         self.noise_factor = noise_factor
+        self._pin_components = self._build_pin_components()
+        # Components wired to DIO0-DIO22, in order, used to answer DIO_STATE requests
+        self._dio_components = [self._pin_components.get(pin) for pin in self.register_map.dio_pins]
+        # Resolved registers for the (start_address, count) blocks requested by FC3 and FC16
+        self._plans = {}
         StatisticsCollector.increment_number_of_devices()
 
-    @staticmethod
-    def _DIO_to_ALT(dio_name) -> str:
-        # get DIO number
-        num = re.compile('.[A-Za-z]*([0-9]+)').search(dio_name).group(1)
-        num = int(num)
-        if 0 <= num <= 7:
-            return 'FIO' + str(num)
-        if 8 <= num <= 15:
-            return 'EIO' + str(num % 8)
-        if 16 <= num <= 19:
-            return 'CIO' + str(num % 16)
-        if 20 <= num <= 22:
-            return 'MIO' + str(num % 20)
-
-
-    '''
-        Converts a register address to a pin on the labjack.
-        Using a mapping defined in the pins_to_registers file.
-        This file must have at least columns 'pin' and 'start_address'
-        https://labjack.com/support/datasheets/t-series/communication/modbus-map
-            Example: address: 0 --> pin: AIN0
-            Example: address: 2016 --> pin: CIO0 (DIO0 removed because of ambiguity) 
-    '''
-    def _registers_to_pins(self, register):
-        try:
-            pin = self.pins.loc[register, 'pin']
-            if type(pin).__name__ == 'Series':
-                return pin.values[-1]
-            return pin
-        except KeyError:
-            print('Start register {} is invalid'.format(register))
-            return 'INVALID_START_REGISTER'
-
     '''
         Converts a pin on the labjack to the sensor, or device it's connected to.
         Uses a mapping defined in the sensor_properties file. This file must at least
@@ -75,49 +54,69 @@ class LabJack:
         of the labjack reading and modifying that device.
             Example: pin: AIN0 --> device: CB-1W.PT-1 (pressure transducer 1)
             Example: pin: CIO0 --> device: CB-1W.EV-14 (electronic vale 14)
+        The components are looked up in the model once, pins without a component are left out.
     '''
-    def _pin_to_sensor(self, pin):
-        return self.sensors.loc[self.sensors['pin'] == pin]
+    def _build_pin_components(self):
+        pin_components = {}
+        for sensor_name, pin in self.sensors:
+            if not pin or pin in pin_components:
+                continue
+            try:
+                component = self.model.get_component(sensor_name)
+            except KeyError:
+                self.logger.warning('LJ:{} {} on pin {} is not in the model', self.port, sensor_name, pin)
+                continue
+            if component:
+                pin_components[pin] = component
+        return pin_components
+
+    def _get_register_info(self, register) -> RegisterInfo:
+        info = self.register_map.get(register)
+        if info is None:
+            print('Start register {} is invalid'.format(register))
+            raise KeyError('Start register {} is invalid'.format(register))
+        return info
+
+    def _set_register(self, pin, value):
+        self.register_data[self.register_map.get(self.register_map.pin_registers[pin]).slot] = value
 
     '''
-        Given a pin, search the modbus map for the next pin. Sometimes the addressing can get
-        weird with the different 8, 16, and 32 bit data types. This method helps clear that up.
+        Copy of the values of every non-component register, indexed by RegisterInfo.slot.
+        Give it to restore_registers to put the labjack back in that state.
     '''
-    def _get_next_pin(self, pin):
-        pin = self.pins.loc[self.pins['pin'] == pin]['next_pin'].values[0]
-        if 'DIO' in pin:
-            return self._DIO_to_ALT(pin)
-        else:
-            return pin
+    def snapshot_registers(self) -> array:
+        return array('d', self.register_data)
 
-    def _get_next_register(self, register):
-        pin = self._registers_to_pins(register)
-        next_pin = self._get_next_pin(pin)
-        next_register = self.pins[self.pins['pin'] == next_pin].index[0]
-        return next_register
+    def restore_registers(self, snapshot: array):
+        self.register_data[:] = snapshot
+
+    def _registers_to_pins(self, register):
+        return self._get_register_info(register).pin
 
     '''
-        Look up the component in the model using the pin and referencing the sensor properties file.
+        For every pin, find the next pin in the modbus map. Sometimes the addressing can get
+        weird with the different 8, 16, and 32 bit data types. This helps clear that up.
     '''
-    def _get_component_from_pin(self, pin) -> ComponentBaseClass:
-        sensor = self._pin_to_sensor(pin)
-        if len(sensor) == 0:
-            return None
-        lookup_name = sensor['name'][0]
-        return self.model.get_component(lookup_name)
+    def _get_next_pin(self, pin):
+        return self.register_map.next_pins[pin]
+
+    def _get_next_register(self, register):
+        return self.register_map.pin_registers[self._get_next_pin(self._registers_to_pins(register))]
 
     def _read_from_sensor(self, component: ComponentBaseClass) -> int:
         comp_type = component.get_type()
-        self.logger.debug('LJ:{} Attempting read from component type {}'.format(self.port, component.get_type()))
+        self.logger.debug('LJ:{} Attempting read from component type {}', self.port, comp_type)
         if component.get_type() not in ['PressureTransducer', 'Thermocouple', 'FlowMeter']:
             raise Exception('Cannot read from non-sensor components')
         if component.get_type() == 'FlowMeter':
             self.logger.debug('Calculating flows and setting meters')
             self.model.calculate_flows(component.get_prefix()) # add component attribute for it's parent gashouse
-        self.logger.debug('LJ:{} {} reading {}'.format(self.port, comp_type, component.get_reading()))
+        # read now, the value may have changed by the time the writer formats the message
+        if self.logger.is_enabled_for(logging.DEBUG):
+            self.logger.debug('LJ:{} {} reading {}', self.port, comp_type, component.get_reading())
         noised_reading = component.get_reading_voltage() + \
             (component.get_reading_voltage() * random.uniform(-self.noise_factor, self.noise_factor))
-        self.logger.info('LJ:{} {} reading noised in volts {}'.format(self.port, comp_type, noised_reading))
+        self.logger.debug('LJ:{} {} reading noised in volts {}', self.port, comp_type, noised_reading)
         return noised_reading
 
     def _write_to_component(self, component: ComponentBaseClass, value_to_set) -> ComponentBaseClass:
@@ -125,7 +124,7 @@ class LabJack:
         if component.get_type() == 'ElectricValve' or component.get_type() == 'ThreeWayElectricValve':
             value_to_set = 'open' if value_to_set == 0 else 'closed'
             self.model.set_valve(component.get_full_name(), value_to_set)
-            self.logger.info('LJ:{} Write {} to component {}'.format(self.port, value_to_set, component))
+            self.logger.info('LJ:{} Write {} to component {}', self.port, value_to_set, component)
         else:
             raise Exception('Cannot write to {} type components'.format(component.get_type()))
         return component
@@ -138,43 +137,52 @@ class LabJack:
     def _convert_register_count_to_pin_count(self, start_register, count):
         pin_count = 0
         # use the indexing to jump over DIO pins when counting
-        current_pin_record = self.pins.loc[start_register]
-        if type(current_pin_record).__name__ == 'DataFrame':
-            current_pin_record = self.pins.loc[start_register][-1:].squeeze()
-        current_pin = current_pin_record['pin']
+        current_pin = self._registers_to_pins(start_register)
         while count > 0:
-            data_type = current_pin_record['data_type']
+            data_type = self.register_map.pin_data_types[current_pin]
             if '32' in data_type:
                 count = count - 2
             else:
                 count = count - 1
             pin_count = pin_count + 1
-            current_pin = self._get_next_pin(current_pin)
-            current_pin_record = self.pins.loc[self.pins['pin'] == current_pin][-1:].T.squeeze()
+            if count > 0:
+                current_pin = self._get_next_pin(current_pin)
         return pin_count
 
+    '''
+        Resolves the registers touched by a multi register request once, the plan is a list of
+        (register, RegisterInfo) that later reads and writes of the same block just loop over.
+        Pollers request the same blocks every cycle, the number of cached plans is bounded by MAX_PLANS.
+    '''
+    def _get_plan(self, start_register, count):
+        plan = self._plans.get((start_register, count))
+        if plan is None:
+            plan = []
+            current_register = start_register
+            for i in range(self._convert_register_count_to_pin_count(start_register, count)):
+                if i > 0:
+                    current_register = self._get_next_register(current_register)
+                plan.append((current_register, self._get_register_info(current_register)))
+            if len(self._plans) >= self.MAX_PLANS:
+                self._plans.clear()
+            self._plans[(start_register, count)] = plan
+        return plan
+
     def _DIO_state_request(self, request_header):
-        # Use next pin as a work around to having to convert every DIO pin
-        pins = self.pins.loc[self.pins['pin'].str.contains('DIO[0-9]+$')]['next_pin'].values
         bit_str = 0xFFFFFFFF
-        for idx, pin in enumerate(pins):
-            component = self._get_component_from_pin(pin)
+        for idx, component in enumerate(self._dio_components):
             if component and 'ElectricValve' in component.get_type():
                 if component.get_reading_voltage() == 0:
                     bit_str = bit_str ^ 0x1 << idx
-        self.logger.info('LJ:{} DIO state request returning {}'.format(self.port, bin(bit_str)))
+        self.logger.debug('LJ:{} DIO state request returning {}', self.port, Lazy(bin, bit_str))
         return encoder.respond_read_registers(request_header, [(bit_str, 'UINT32')], self.ENDIANNESS)
 
-    def _read_write_register(self, register_address, write_value=None):
+    def _read_write_register(self, register_address, write_value=None, info=None):
         # self.logger.debug('Request at address {}'.format(register_address))
-        pin = self._registers_to_pins(register_address)
-        # EF_READ is used to read without setting the mode, just read from whatever virtual_pin corresponds
-        if 'EF_READ_A' in pin and write_value is None:
-            pin = pin.split('_')[0]
-        component = self._get_component_from_pin(pin)
-        data_type = self.pins.loc[register_address, 'data_type']
-        if type(data_type).__name__ == 'Series':
-            data_type = data_type.values[0]
+        if info is None:
+            info = self._get_register_info(register_address)
+        component = self._pin_components.get(info.pin if write_value is not None else info.read_pin)
+        data_type = info.data_type
         if component:
             if write_value is not None:
                 return self._write_to_component(component, write_value), data_type
@@ -182,14 +190,18 @@ class LabJack:
                 return self._read_from_sensor(component), data_type
         else:
             if write_value is not None:
-                self.pins.loc[register_address, 'data'] = write_value
-                self.logger.debug('LJ:{} Writing to non-component register {} value now {}'
-                                  .format(self.port, register_address, self.pins.loc[register_address, 'data']))
+                self.register_data[info.slot] = write_value
+                self.logger.debug('LJ:{} Writing to non-component register {} value now {}', self.port,
+                                  register_address, write_value)
                 return write_value, data_type
             else:
-                self.logger.debug('LJ:{} Read from non component register {} value {}'
-                                  .format(self.port, register_address, self.pins.loc[register_address, 'data']))
-                return self.pins.loc[register_address, 'data'], data_type
+                value = self.register_data[info.slot]
+                # the register file holds doubles, everything but floats is packed as an integer
+                if data_type != 'FLOAT32':
+                    value = int(value)
+                self.logger.debug('LJ:{} Read from non component register {} value {}', self.port,
+                                  register_address, value)
+                return value, data_type
 
     '''
         Handles decoded Modbus requests and takes action based on requested methods.
@@ -211,8 +223,8 @@ class LabJack:
         #     self.logger.info('Request for hardware version returning 0')
         #     return encoder.respond_read_registers(request_header, [(0, 'FLOAT32')], self.ENDIANNESS)
 
-        pin = self._registers_to_pins(request_body['address'])
-        if re.compile('.*_STATE$').match(pin):
+        info = self.register_map.get(request_body['address'])
+        if info and info.is_state:
             return self._DIO_state_request(request_header)
         try:
             # read one register
@@ -226,23 +238,15 @@ class LabJack:
                 return encoder.respond_write_registers(request_header, request_body['address'], num_registers_written)
             # write multiple
             elif request_header['function_code'] == 16:
-                current_register = request_body['address']
                 values = request_body['values']
-                pin_count = self._convert_register_count_to_pin_count(request_body['address'], request_body['count'])
-                for i in range(pin_count):
-                    value_to_set = values[i]
-                    self._read_write_register(current_register, value_to_set)
-                    current_register = self._get_next_register(current_register)
+                for i, (register, info) in enumerate(self._get_plan(request_body['address'], request_body['count'])):
+                    self._read_write_register(register, values[i], info)
                 return encoder.respond_write_registers(request_header, request_body['address'], request_body['count'])
             # read multiple
             elif request_header['function_code'] == 3:
-                current_register = request_body['address']
                 values = []
-                pin_count = self._convert_register_count_to_pin_count(request_body['address'], request_body['count'])
-                for i in range(pin_count):
-                    reading, current_dtype = self._read_write_register(current_register)
-                    values.append((reading, current_dtype))
-                    current_register = self._get_next_register(current_register)
+                for register, info in self._get_plan(request_body['address'], request_body['count']):
+                    values.append(self._read_write_register(register, info=info))
                 return encoder.respond_read_registers(request_header, values, self.ENDIANNESS)
             else:
                 return decoder.invalid_function_code([request_header['function_code']])[1]
@@ -259,6 +263,13 @@ class LabJack:
     def start_server(self):
         self.receiver.start_server(self.on_request)
 
+    '''
+        Registers the modbus receiver with a shared modbushandler.AsyncModbusServer instead of
+        blocking a thread of its own. Requests are still handled by on_request.
+    '''
+    def start_server_async(self, server):
+        server.add_receiver(self.receiver, self.on_request)
+
     def stop_server(self):
         self.receiver.stop_server()
 
@@ -0,0 +1,29 @@
+import csv
+from typing import List, Tuple
+
+
+class ReaderSensors:
+
+    """
+        Sensor properties partitioned by the name of the labjack reading them. Each sensor_properties file is
+        parsed once and shared by every LabJack, get the (name, pin) pairs of one reader with ReaderSensors.get.
+        This file must at least contain columns 'pin', 'name' for the name of the sensor/device, and 'reader'
+        for the name of the labjack reading and modifying that device.
+    """
+
+    loaded_files = {}
+
+    def __init__(self, sensor_properties_file):
+        self.file_path = sensor_properties_file
+        self.readers = {}
+        with open(sensor_properties_file, 'r') as csv_file:
+            for row in csv.DictReader(csv_file):
+                self.readers.setdefault(row['reader'], []).append((row['name'], row['pin']))
+        for reader, sensors in self.readers.items():
+            self.readers[reader] = tuple(sensors)
+
+    @staticmethod
+    def get(sensor_properties_file, reader) -> List[Tuple[str, str]]:
+        if sensor_properties_file not in ReaderSensors.loaded_files:
+            ReaderSensors.loaded_files[sensor_properties_file] = ReaderSensors(sensor_properties_file)
+        return ReaderSensors.loaded_files[sensor_properties_file].readers.get(reader, ())
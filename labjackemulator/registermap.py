@@ -0,0 +1,89 @@
+import csv
+import re
+from collections import namedtuple
+from types import MappingProxyType
+
+# Everything needed to serve one register address. read_pin is the pin used for reads,
+# EF_READ is used to read without setting the mode, just read from whatever virtual_pin corresponds.
+# slot is the index of the address in a labjack's register file, addresses are numbered in map order
+RegisterInfo = namedtuple('RegisterInfo', ['pin', 'data_type', 'access', 'read_pin', 'is_state', 'slot'])
+
+
+class RegisterMap:
+
+    """
+        Read only view of a pins_to_registers file (the LabJack modbus map). The file is parsed once and the same
+        map is shared by every LabJack that uses it, get one with RegisterMap.load.
+        This file must have at least columns 'pin', 'start_address', 'data_type', 'access' and 'next_pin'
+        https://labjack.com/support/datasheets/t-series/communication/modbus-map
+            Example: address: 0 --> pin: AIN0
+            Example: address: 2016 --> pin: CIO0 (DIO0 removed because of ambiguity)
+        Addresses shared by several pins resolve to the last pin listed, but take their data type from the first.
+    """
+
+    loaded_maps = {}
+
+    def __init__(self, pins_to_registers_file):
+        self.file_path = pins_to_registers_file
+        registers = {}
+        next_pins = {}
+        pin_data_types = {}
+        pin_registers = {}
+        dio_pins = []
+        state_pattern = re.compile('.*_STATE$')
+        dio_pattern = re.compile('DIO[0-9]+$')
+        with open(pins_to_registers_file, 'r') as csv_file:
+            for row in csv.DictReader(csv_file):
+                pin = row['pin']
+                register = int(row['start_address'])
+                data_type, access = row['data_type'], row['access']
+                info = registers.get(register)
+                slot = len(registers)
+                if info:
+                    data_type, access, slot = info.data_type, info.access, info.slot
+                read_pin = pin.split('_')[0] if 'EF_READ_A' in pin else pin
+                registers[register] = RegisterInfo(pin, data_type, access, read_pin,
+                                                   state_pattern.match(pin) is not None, slot)
+                pin_data_types[pin] = row['data_type']
+                pin_registers.setdefault(pin, register)
+                next_pin = row['next_pin']
+                if next_pin and pin not in next_pins:
+                    # DIO lines go by their FIO/EIO/CIO/MIO names, DIO3_EF_READ_A --> FIO3
+                    alt_pin = self.DIO_to_ALT(next_pin) if 'DIO' in next_pin else None
+                    next_pins[pin] = alt_pin or next_pin
+                # Use next pin as a work around to having to convert every DIO pin
+                if dio_pattern.match(pin):
+                    dio_pins.append(next_pin)
+        self.registers = MappingProxyType(registers)
+        self.next_pins = MappingProxyType(next_pins)
+        self.pin_data_types = MappingProxyType(pin_data_types)
+        self.pin_registers = MappingProxyType(pin_registers)
+        self.dio_pins = tuple(dio_pins)
+
+    @staticmethod
+    def load(pins_to_registers_file) -> 'RegisterMap':
+        if pins_to_registers_file not in RegisterMap.loaded_maps:
+            RegisterMap.loaded_maps[pins_to_registers_file] = RegisterMap(pins_to_registers_file)
+        return RegisterMap.loaded_maps[pins_to_registers_file]
+
+    @staticmethod
+    def DIO_to_ALT(dio_name) -> str:
+        # get DIO number, names without one (DIO_STATE) have no alternative
+        match = re.compile('.[A-Za-z]*([0-9]+)').search(dio_name)
+        if match is None:
+            return None
+        num = int(match.group(1))
+        if 0 <= num <= 7:
+            return 'FIO' + str(num)
+        if 8 <= num <= 15:
+            return 'EIO' + str(num % 8)
+        if 16 <= num <= 19:
+            return 'CIO' + str(num % 16)
+        if 20 <= num <= 22:
+            return 'MIO' + str(num % 20)
+
+    def get(self, register) -> RegisterInfo:
+        return self.registers.get(register)
+
+    def __len__(self):
+        return len(self.registers)
@@ -1,60 +1,313 @@
+import atexit
 import logging
+import queue
+import threading
 import time
 import pathlib
 import os
 
+"""
+    Loggers of the servers, labjacks and the model. Messages are brace format strings with their arguments,
+    they are only formatted if the level of the logger is enabled, and then by a background writer thread so
+    request threads never wait on the log files. The queue to the writer holds at most max_queued messages,
+    messages logged while it is full are dropped and counted so a slow disk can't grow it without bound.
+    Every log file has a single buffered handler shared by all loggers
+    writing to it, flushed when its buffer fills up and at least every flush_interval seconds.
+    Levels can be set for all loggers or per subsystem, the part of the logger name before the port/number
+    (ServerLogger-501 is in subsystem ServerLogger).
+"""
+
+
+class Lazy:
+
+    """
+        Log argument computed when the message is written, e.g. Lazy(stringify_bytes, buffer).
+        Nothing is computed for messages below the level of the logger. fn runs later on the writer thread,
+        so it should only depend on its args, not on state that may change in the meantime.
+    """
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    # Buffers may be reused once the call returned, the writer formats a copy
+    def freeze(self):
+        self.args = tuple(bytes(arg) if isinstance(arg, (memoryview, bytearray)) else arg for arg in self.args)
+        return self
+
+    def __str__(self):
+        return str(self.fn(*self.args))
+
+    def __format__(self, format_spec):
+        return format(self.fn(*self.args), format_spec)
+
+
+class _Message:
+
+    __slots__ = ('fmt', 'args')
+
+    def __init__(self, fmt, args):
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self):
+        return self.fmt.format(*self.args) if self.args else self.fmt
+
+
+class BufferedFileHandler(logging.Handler):
+
+    """
+        Keeps its file open and writes formatted records in batches of up to capacity records.
+        Only the writer thread emits, flush can be called from any thread.
+    """
+    def __init__(self, path, capacity=512):
+        super().__init__()
+        self.path = path
+        self.capacity = capacity
+        self.buffer = []
+        self.stream = open(path, 'a')
+
+    def emit(self, record):
+        self.buffer.append(self.format(record))
+        if len(self.buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer and not self.stream.closed:
+                self.buffer.append('')
+                self.stream.write('\n'.join(self.buffer))
+                self.stream.flush()
+                self.buffer.clear()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush()
+            self.stream.close()
+        finally:
+            self.release()
+        super().close()
+
+
+class _QueueHandler(logging.Handler):
+
+    """
+        Hands records to the writer thread, which passes them on to target
+    """
+    def __init__(self, target: logging.Handler):
+        super().__init__()
+        self.target = target
+
+    def emit(self, record):
+        try:
+            Logger.writer_queue.put_nowait((self.target, record))
+        except queue.Full:
+            Logger.count_dropped()
+
 
 class Logger:
 
     active_loggers = {}
     level = logging.INFO
+    # Levels of subsystems that don't log at Logger.level, see set_level
+    levels = {}
     logger_dir = '.'
+    # Messages waiting for the writer, and the number dropped because the queue was full
+    max_queued = 65536
+    writer_queue = queue.Queue(maxsize=max_queued)
+    dropped_messages = 0
+    _dropped_lock = threading.Lock()
+    # Handler of every log file by path, and seconds between flushes of the buffered files
+    file_handlers = {}
+    flush_interval = 1.0
+    # Name of the timestamped log directories, taken once so every logger of the process writes to the same one
+    run_time = None
+    _writer = None
+    _writer_lock = threading.Lock()
 
     def __init__(self, logger_name, filename, prefix=None):
         self.prefix = prefix + ' ' if prefix is not None else ''
         self.logger = self.set_up_logger(logger_name, filename)
 
-    def debug(self, msg):
-        self.logger.debug(self.prefix + msg)
+    '''
+        msg is a brace format string, args are only formatted (and Lazy args computed) if the level is enabled
+    '''
+    def debug(self, msg, *args):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._log(logging.DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        if self.logger.isEnabledFor(logging.INFO):
+            self._log(logging.INFO, msg, args)
 
-    def info(self, msg):
-        self.logger.info(self.prefix + msg)
+    def warning(self, msg, *args):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self._log(logging.WARNING, msg, args)
+
+    def is_enabled_for(self, level) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    '''
+        Arguments as they are at the time of the call. Lazy arguments copy their buffers,
+        containers that may still be changed by the caller are formatted right away.
+    '''
+    @staticmethod
+    def _freeze(arg):
+        if isinstance(arg, Lazy):
+            return arg.freeze()
+        if isinstance(arg, (dict, list, set, bytearray, memoryview)):
+            return str(bytes(arg) if isinstance(arg, (bytearray, memoryview)) else arg)
+        return arg
 
-    def warning(self, msg):
-        self.logger.warning(self.prefix + msg)
+    def _log(self, level, msg, args):
+        args = tuple(self._freeze(arg) for arg in args)
+        # makeRecord instead of Logger.log, which walks the stack to find the caller
+        message = _Message(self.prefix + msg, args)
+        record = self.logger.makeRecord(self.logger.name, level, '(unknown file)', 0, message, (), None)
+        self.logger.handle(record)
 
     @staticmethod
     def get_dir():
         return str(Logger.logger_dir)
 
+    @staticmethod
+    def get_run_time() -> str:
+        with Logger._writer_lock:
+            if Logger.run_time is None:
+                Logger.run_time = time.strftime("%Y-%m-%d-%H:%M")
+            return Logger.run_time
+
+    @staticmethod
+    def get_subsystem(logger_name) -> str:
+        return logger_name.split('-')[0]
+
+    @staticmethod
+    def get_level(logger_name):
+        return Logger.levels.get(Logger.get_subsystem(logger_name), Logger.level)
+
+    '''
+        Sets the level of every logger, or only of the loggers of subsystem (e.g. 'ServerLogger').
+        Levels are logging levels or their names, loggers created later pick them up too.
+    '''
+    @staticmethod
+    def set_level(level, subsystem=None):
+        if subsystem is None:
+            Logger.level = level
+        else:
+            Logger.levels[subsystem] = level
+        for logger_name, logger in Logger.active_loggers.items():
+            logger.setLevel(Logger.get_level(logger_name))
+
+    @staticmethod
+    def _start_writer():
+        with Logger._writer_lock:
+            if Logger._writer is None:
+                Logger._writer = threading.Thread(target=Logger._write, name='LogWriter', daemon=True)
+                Logger._writer.start()
+                atexit.register(Logger.flush)
+
+    @staticmethod
+    def count_dropped():
+        with Logger._dropped_lock:
+            Logger.dropped_messages = Logger.dropped_messages + 1
+
+    @staticmethod
+    def _flush_files():
+        for handler in list(Logger.file_handlers.values()):
+            handler.target.flush()
+
+    '''
+        Writes a warning about the messages dropped since the last report to every log file
+    '''
+    @staticmethod
+    def _report_dropped(count):
+        record = logging.makeLogRecord({'name': 'Logger', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                        'msg': '{} log messages dropped, the writer queue was full'.format(count)})
+        for handler in list(Logger.file_handlers.values()):
+            try:
+                handler.target.handle(record)
+            except Exception:
+                handler.target.handleError(record)
+
+    @staticmethod
+    def _write():
+        last_flush = time.monotonic()
+        reported = 0
+        while True:
+            try:
+                target, record = Logger.writer_queue.get(timeout=Logger.flush_interval)
+            except queue.Empty:
+                target, record = None, None
+            if target is not None:
+                try:
+                    target.handle(record)
+                except Exception:
+                    target.handleError(record)
+            # flush markers are (None, event), an empty queue is (None, None)
+            if target is None or time.monotonic() - last_flush >= Logger.flush_interval:
+                dropped = Logger.dropped_messages
+                if dropped > reported:
+                    Logger._report_dropped(dropped - reported)
+                    reported = dropped
+                Logger._flush_files()
+                last_flush = time.monotonic()
+            if target is None and record is not None:
+                record.set()
+
+    '''
+        Waits until every message logged so far is written to its file, or timeout seconds passed.
+        Unlike messages the flush marker waits for room in a full queue.
+    '''
+    @staticmethod
+    def flush(timeout=5) -> bool:
+        if Logger._writer is None:
+            return True
+        done = threading.Event()
+        deadline = time.monotonic() + timeout
+        try:
+            Logger.writer_queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(0, deadline - time.monotonic()))
+
+    '''
+        Handler of the log file at path, created by the first logger writing to it.
+        The file is written by the writer thread, see _write.
+    '''
+    @staticmethod
+    def get_file_handler(path, prefix=None) -> logging.Handler:
+        with Logger._writer_lock:
+            if path not in Logger.file_handlers:
+                handler = BufferedFileHandler(path)
+                # create formatter
+                if prefix:
+                    formatter = logging.Formatter("[%(levelname)s] {} %(asctime)s - %(message)s".format(prefix))
+                else:
+                    formatter = logging.Formatter("[%(levelname)s] %(asctime)s - %(message)s")
+                handler.setFormatter(formatter)
+                Logger.file_handlers[path] = _QueueHandler(handler)
+            return Logger.file_handlers[path]
+
     def set_up_logger(self, logger_name, filename, prefix=None):
         if logger_name in self.active_loggers:
             return self.active_loggers[logger_name]
         else:
             # Set up a specific logger with our desired output level
             logger = logging.getLogger(logger_name)
-            # logger.setLevel(logging.DEBUG)
-            logger.setLevel(Logger.level)
-            timestr = time.strftime("%Y-%m-%d-%H:%M")
+            logger.setLevel(Logger.get_level(logger_name))
+            timestr = Logger.get_run_time()
             p = pathlib.PurePath(filename)
             parent = p.parent
             name = p.name
             path = parent.joinpath(timestr).joinpath(name)
             os.makedirs(path.parent, exist_ok=True)
             Logger.logger_dir = path.parent
-            handler = logging.FileHandler(str(path), mode='a')
-            # handler.setLevel(logging.DEBUG)
-            handler.setLevel(Logger.level)
-            # create formatter
-            if prefix:
-                formatter = logging.Formatter("[%(levelname)s] {} %(asctime)s - %(message)s".format(prefix))
-            else:
-                formatter = logging.Formatter("[%(levelname)s] %(asctime)s - %(message)s")
-            # add formatter to ch
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            logger.addHandler(self.get_file_handler(str(path), prefix))
+            Logger._start_writer()
             self.active_loggers[logger_name] = logger
             return logger
-
-
-
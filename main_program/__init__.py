@@ -1 +1,2 @@
 from .labjackthread import LabJackThread
+from .serverloopthread import ServerLoopThread
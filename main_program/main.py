@@ -8,6 +8,8 @@ sys.path.insert(0, '/var/root/PycharmProjects/metec_model')
 from metecmodel import Model, StatisticsCollector
 from labjackemulator import LabJack
 from main_program.labjackthread import LabJackThread
+from main_program.serverloopthread import ServerLoopThread
+from modbushandler import AsyncModbusServer
 from logger import Logger
 from metecmodel.networkgraph import NetworkModel
 
@@ -33,9 +35,14 @@ def get_command_line_args():
 if __name__ == '__main__':
     cmd_args = get_command_line_args()
     config = load_config_file(cmd_args.main_config)
+    # log_level applies to every logger, log_levels overrides it per subsystem (e.g. ServerLogger: DEBUG)
+    Logger.set_level(config.get('log_level', 'INFO'))
+    for subsystem, level in config.get('log_levels', {}).items():
+        Logger.set_level(level, subsystem)
     model = Model(config['sensor_properties'], config['volumes_files'], config['gashouses'],
                   initial_pressure=config['initial_pressures'], initial_temperature=config['initial_temperatures'],
-                  failures=config.get('component_failures', {}))
+                  failures=config.get('component_failures', {}),
+                  graph_backend=config.get('graph_backend', 'networkx'))
 
     for valve, state in config['valve_states'].items():
         model.set_valve(valve, state)
@@ -44,18 +51,34 @@ if __name__ == '__main__':
     socket_type = socket.SOCK_STREAM if config['socket_type'] == 'TCP' else socket.SOCK_DGRAM
     labjack_threads = []
     labjacks = {}
+    # 'async' serves every labjack from one event loop, 'threaded' runs one blocking server thread per labjack
+    async_server = AsyncModbusServer() if config.get('server_mode', 'threaded') == 'async' else None
     print('Creating {} LabJacks'.format(len(labjack_names_data)))
     for name, data in labjack_names_data.items():
         port = data['port']
         failures = data.get('failures', {})
+        # connection limits can be set for every labjack, or per labjack in its own entry
+        max_connections = data.get('max_connections', config.get('max_connections', 5))
+        idle_timeout = data.get('idle_timeout', config.get('idle_timeout', None))
         labjack = LabJack(name, config['pins_to_registers'], config['sensor_properties'], model, port,
                           localhost=config['localhost'], socket_type=socket_type, noise_factor=config['noise_factor'],
-                          failures=failures)
+                          failures=failures, max_connections=max_connections, idle_timeout=idle_timeout)
         labjacks[name] = labjack
+        if async_server:
+            labjack.start_server_async(async_server)
+            continue
         lj_thread = LabJackThread(labjack)
         labjack_threads.append(lj_thread)
         lj_thread.start()
 
+    if async_server:
+        server_thread = ServerLoopThread(async_server)
+        labjack_threads.append(server_thread)
+        server_thread.start()
+        async_server.started.wait()
+        for receiver, error in async_server.get_failed():
+            print('Could not start server on port {}: {}'.format(receiver.port, error))
+
     network_model = NetworkModel(cmd_args.network_config, labjacks)
 
     try:
@@ -92,7 +115,7 @@ if __name__ == '__main__':
                     print(model.are_connected(first_component, second_component))
                 if char == 'N':
                     component = input('Input component name: ')
-                    print(model.graph.graph.edges(component))
+                    print(model.get_edges(component))
                 if char == 'R':
                     component = input('Input component name: ')
                     reading = model.get_component(component).get_reading()
@@ -115,10 +138,17 @@ if __name__ == '__main__':
                     state = input("'open' or 'close': ")
                     print('Valve now:', model.set_valve(valve_name, state))
                 if char == 'S':
-                    print(StatisticsCollector.get_stats())
+                    stats = StatisticsCollector.get_stats()
+                    latency = stats.pop('latency')
+                    print(stats)
+                    print('Response times (ms): {}'.format(latency['all']))
+                    for port, summary in latency['ports'].items():
+                        print('  Port {}: {}'.format(port, summary))
+                    for function_code, summary in latency['function_codes'].items():
+                        print('  Function code {}: {}'.format(function_code, summary))
                 if char == 'G':
                     print('Saving graph...')
-                    model.graph.save_graph(Logger.get_dir() + '/graph_' + time.strftime("%Y-%m-%d-%H:%M") + '.gml')
+                    model.save_graph(Logger.get_dir() + '/graph_' + time.strftime("%Y-%m-%d-%H:%M") + '.gml')
                     print('Graph saved')
                 if char == 'D':
                     labjack_to_fail = input('Input the full name of the labjack to kill (ex: CB-1W.LJ-1): ').upper()
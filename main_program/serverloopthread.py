@@ -0,0 +1,15 @@
+from threading import Thread
+
+
+class ServerLoopThread(Thread):
+
+    def __init__(self, server):
+        Thread.__init__(self)
+        self.server = server
+        self.daemon = True
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.stop()
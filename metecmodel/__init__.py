@@ -3,5 +3,8 @@ from .sensorpropertiesparser import SensorPropertiesParser
 from .volumesparser import VolumesParser
 from .parsemultiplevolumes import ParseMultipleVolumes
 from .emissionstable import EmissionsTable
+from .emissionsbatch import EmissionsBatch
+from .sensorstatestore import SensorStateStore
 from .model import Model
+from .latencyhistogram import LatencyHistogram
 from .statisticscollector import StatisticsCollector
@@ -5,6 +5,8 @@ from metecmodel.graph import GraphNode
 
 class ElectricValve(ComponentBaseClass, GraphNode):
 
+    __slots__ = ('neighbors', 'state', 'failure_rate')
+
     def __init__(self, name, neighbors, data={}, initial_state='closed', failure_rate=0):
         ComponentBaseClass.__init__(self, name, data)
         GraphNode.__init__(self, name, neighbors)
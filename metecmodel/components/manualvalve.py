@@ -5,6 +5,8 @@ from typing import List
 
 class ManualValve(ComponentBaseClass, GraphNode):
 
+    __slots__ = ('neighbors', 'state')
+
     def __init__(self, name, neighbors, data={}, initial_state='open'):
         ComponentBaseClass.__init__(self, name, data)
         GraphNode.__init__(self, name, neighbors)
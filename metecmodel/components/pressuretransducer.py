@@ -1,21 +1,37 @@
 from interfaces import ComponentBaseClass
 from metecmodel.graph import GraphNode
+from metecmodel.sensorstatestore import SensorStateStore
 import random
 
 
 class PressureTransducer(ComponentBaseClass, GraphNode):
 
-    def __init__(self, name, neighbors, data={}, initial_pressure=50, failure_rate=0, failure_type='random'):
+    __slots__ = ('neighbors', 'store', 'sid')
+
+    def __init__(self, name, neighbors, data={}, initial_pressure=50, failure_rate=0, failure_type='random',
+                 store: SensorStateStore = None, group=None):
         ComponentBaseClass.__init__(self, name, data)
         GraphNode.__init__(self, name, neighbors)
-        self.pressure = initial_pressure
-        self.failure_rate = failure_rate
-        self.failure_type = failure_type
-        data['slope'] = float(data.get('slope', 1))
-        data['offset'] = float(data.get('offset', 0))
-        data['output_units'] = data.get('output_units', 'IN-DIA')
-        data['min'] = data.get('min', 0)
-        data['max'] = data.get('max', 0)
+        # State is kept in the sensor store, a PressureTransducer made on its own gets a store of its own
+        self.store = store if store is not None else SensorStateStore(capacity=1)
+        self.sid = self.store.add(SensorStateStore.PRESSURE, group, initial_pressure, self.parse_float(data.get('slope'), 1),
+                                  self.parse_float(data.get('offset')), failure_rate, failure_type)
+
+    @property
+    def pressure(self):
+        return float(self.store.pressure[self.sid])
+
+    @pressure.setter
+    def pressure(self, value):
+        self.store.pressure[self.sid] = value
+
+    @property
+    def failure_rate(self):
+        return float(self.store.failure_rate[self.sid])
+
+    @property
+    def failure_type(self):
+        return self.store.get_failure_type(self.sid)
 
     def get_reading(self) -> float:
         return self.pressure
@@ -29,5 +45,5 @@ class PressureTransducer(ComponentBaseClass, GraphNode):
             if self.failure_type == 'NaN':
                 return float('NaN')
         reading = self.get_reading()
-        reading = reading - self.data['offset']
-        return reading / self.data['slope']
+        reading = reading - self.store.offset[self.sid]
+        return reading / self.store.slope[self.sid]
@@ -5,6 +5,8 @@ from metecmodel.graph import GraphNode
 
 class ThreeWayElectricValve(ComponentBaseClass, GraphNode):
 
+    __slots__ = ('neighbors', 'state')
+
     def __init__(self, name, neighbors, data={}, initial_state='a'):
         ComponentBaseClass.__init__(self, name, data)
         GraphNode.__init__(self, name, neighbors)
@@ -9,6 +9,7 @@ class ControllerBox:
 
     three_by_four_styles = ['W', 'S']
     two_by_five_styles = ['T']
+    EMISSIONS_DIRECTORY = '../Resources/Emissions/'
 
     def __init__(self, name: str, components: Dict = {}):
         self.name = name
@@ -24,32 +25,42 @@ class ControllerBox:
     def get_component(self, name) -> ComponentBaseClass:
         return self.components.get(name, None)
 
+    '''
+        For every row, the valve states as a bitmask code (bit valve-1 set when the valve is open, see
+        EmissionsTable.valve_state_code) and the emissions table of that row.
+    '''
     def _get_valves_and_file(self, rows, valves):
         valve_file = []
         for row in rows:
-            binary_str = ['0'] * len(valves)
+            code = 0
             for valve in valves:
                 valve_name = '{}.EV-{}{}'.format(self.get_name(), row, valve)
                 component: ElectricValve = self.get_component(valve_name)
-                if component.get_reading() is 'open':
-                    binary_str[valve-1] = '1'
-            valve_str = ''.join(binary_str)
+                if component.get_reading() == 'open':
+                    code = code | 1 << (valve - 1)
             file = 'emissions_{}_{}_row{}.csv'.format(len(rows), len(valves) + 1, row)
-            valve_file.append((valve_str, file))
+            valve_file.append((code, file))
         return valve_file
 
-    def get_emissions(self, inlet_pressure):
+    '''
+        The valve state code and emissions table file of every row of the box, empty for boxes without emissions
+    '''
+    def get_row_valve_states(self):
         if self.name[-1] in self.three_by_four_styles:
-            valves_files = self._get_valves_and_file(range(1, 4), range(1, 4))
+            return self._get_valves_and_file(range(1, 4), range(1, 4))
         elif self.name[-1] in self.two_by_five_styles:
-            valves_files = self._get_valves_and_file(range(1, 3), range(1, 5))
-        else:
+            return self._get_valves_and_file(range(1, 3), range(1, 5))
+        return []
+
+    def get_emissions(self, inlet_pressure):
+        valves_files = self.get_row_valve_states()
+        if not valves_files:
             return 0
         i = 0
         emissions = []
         for valve_states, file in valves_files:
-            em = EmissionsTable('../Resources/Emissions/' + file).get_emissions(inlet_pressure, valve_states)
-            self.logger.debug('Evaluating emissions (Controller Box: {}, Row {}) - {}'.format(self.name, i, em))
+            em = EmissionsTable.load(self.EMISSIONS_DIRECTORY + file).get_emissions(inlet_pressure, valve_states)
+            self.logger.debug('Evaluating emissions (Controller Box: {}, Row {}) - {}', self.name, i, em)
             i = i + 1
             emissions.append(em)
         return emissions
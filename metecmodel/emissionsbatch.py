@@ -0,0 +1,49 @@
+import numpy as np
+from typing import List
+from .emissionstable import EmissionsTable
+
+"""
+    Several emissions tables stacked together so the emissions of many rows, each with its own table,
+    pressure and valve state code, are evaluated in one pass.
+"""
+
+
+class EmissionsBatch:
+
+    def __init__(self, tables: List[EmissionsTable]):
+        self.tables = tables
+        rows = max(len(table.pressures) for table in tables)
+        codes = max(table.emissions.shape[1] for table in tables)
+        # Tables are padded to the same size, padded pressures are inf so they are never below a pressure
+        self.row_counts = np.array([len(table.pressures) for table in tables])
+        self.pressures = np.full((len(tables), rows), np.inf)
+        self.emissions = np.zeros((len(tables), rows, codes))
+        for i, table in enumerate(tables):
+            self.pressures[i, :len(table.pressures)] = table.pressures
+            self.emissions[i, :len(table.pressures), :table.emissions.shape[1]] = table.emissions
+        self._table_index = np.arange(len(tables))
+
+    '''
+        Emissions of every table at pressures[i] with valve state codes[i], same as calling
+        tables[i].get_emissions(pressures[i], codes[i]) for every table.
+        Exact pressures are read from the table, others are interpolated between the surrounding rows.
+    '''
+    def get_emissions(self, pressures, codes) -> np.ndarray:
+        pressures = np.asarray(pressures, dtype=float)
+        codes = np.asarray(codes, dtype=int)
+        tables = self._table_index
+        # searchsorted on every table at once, the next row is the number of table pressures below the pressure
+        next_row = (self.pressures < pressures[:, None]).sum(axis=1)
+        if np.any(next_row >= self.row_counts):
+            raise IndexError('Pressure above the emissions table')
+        # below the first pressure the previous row wraps around to the last one, like EmissionsTable
+        previous_row = np.where(next_row == 0, self.row_counts - 1, next_row - 1)
+        next_index = self.pressures[tables, next_row]
+        previous_index = self.pressures[tables, previous_row]
+        next_value = self.emissions[tables, next_row, codes]
+        previous_value = self.emissions[tables, previous_row, codes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            linear_slope = (next_value - previous_value) / (next_index - previous_index)
+            linear_offset = (next_value - linear_slope * next_index)
+            interpolated = linear_slope * pressures + linear_offset
+        return np.where(next_index == pressures, next_value, interpolated)
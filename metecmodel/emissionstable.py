@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from threading import Lock
 
 """
     In memory reference to a prerecord emissions table. The emissions table is specified in:
@@ -9,28 +10,63 @@ import numpy as np
 
 class EmissionsTable:
 
+    # Every table read so far by file path, tables are read once per process and shared, get them with load
+    loaded_tables = {}
+    _load_lock = Lock()
+
     def __init__(self, file_path):
-        self.table = self._parse_emissions_table(file_path)
+        self.file_path = file_path
+        table = self._parse_emissions_table(file_path)
+        # Sorted pressures of the rows, and emissions as a (pressure x valve state code) array
+        self.pressures = table.index.to_numpy(dtype=float)
+        self.emissions = np.zeros((len(table.index), len(table.columns)))
+        for valve_states in table.columns:
+            self.emissions[:, self.valve_state_code(valve_states)] = table[valve_states].to_numpy(dtype=float)
+
+    @staticmethod
+    def load(file_path) -> 'EmissionsTable':
+        table = EmissionsTable.loaded_tables.get(file_path)
+        if table is None:
+            with EmissionsTable._load_lock:
+                table = EmissionsTable.loaded_tables.get(file_path)
+                if table is None:
+                    table = EmissionsTable(file_path)
+                    EmissionsTable.loaded_tables[file_path] = table
+        return table
 
     @staticmethod
     def _parse_emissions_table(path) -> pd.DataFrame:
         df = pd.read_csv(path, sep='\s+').set_index('p')
         return df
 
-    def _linear_interpolate(self, inlet_pressure, valve_states):
-        next_row = np.searchsorted(self.table.index, inlet_pressure)
+    '''
+        Valve states are written as a string with one character per valve, '1' for open.
+        The code sets bit i when valve i+1 is open, e.g. '0110' --> 6, it is the column of the valve states.
+    '''
+    @staticmethod
+    def valve_state_code(valve_states) -> int:
+        if isinstance(valve_states, str):
+            return sum(1 << i for i, state in enumerate(valve_states) if state == '1')
+        return valve_states
+
+    def _linear_interpolate(self, inlet_pressure, code):
+        next_row = np.searchsorted(self.pressures, inlet_pressure)
         previous_row = next_row - 1
-        next_index = self.table.index[next_row]
-        previous_index = self.table.index[previous_row]
-        next_value = self.table.loc[next_index, valve_states]
-        previous_value = self.table.loc[previous_index, valve_states]
+        next_index = self.pressures[next_row]
+        previous_index = self.pressures[previous_row]
+        next_value = self.emissions[next_row, code]
+        previous_value = self.emissions[previous_row, code]
         linear_slope = (next_value - previous_value) / (next_index - previous_index)
         linear_offset = (next_value - linear_slope * next_index)
         return linear_slope * inlet_pressure + linear_offset
 
+    '''
+        valve_states can be the valve state string or its code, see valve_state_code
+    '''
     def get_emissions(self, inlet_pressure, valve_states) -> float:
-        try:
-            return self.table.loc[inlet_pressure, valve_states]
-        except KeyError:
-            # if it's not in the table we need to interpolate it
-            return self._linear_interpolate(inlet_pressure, valve_states)
\ No newline at end of file
+        code = self.valve_state_code(valve_states)
+        row = np.searchsorted(self.pressures, inlet_pressure)
+        if row < len(self.pressures) and self.pressures[row] == inlet_pressure:
+            return self.emissions[row, code]
+        # if it's not in the table we need to interpolate it
+        return self._linear_interpolate(inlet_pressure, code)
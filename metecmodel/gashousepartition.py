@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from metecmodel.rwlock import ReadWriteLock
+
+"""
+    Everything the model keeps for one gashouse. Piping never crosses gashouses, so every gashouse has its own
+    P&ID subgraph, caches and lock, and labjacks on different gashouses don't contend with each other.
+"""
+
+
+class GashousePartition:
+
+    def __init__(self, name, graph):
+        self.name = name
+        self.graph = graph
+        self.lock = ReadWriteLock()
+        self.controller_boxes = {}
+        # Bumped by anything that changes the flows of the gashouse, flows are cached as (version, flows)
+        self.state_version = 0
+        self.flow_cache = None
+        # Stacked emissions tables of every controller box row of the gashouse
+        self.emissions_batch = None
+        # Bit of every valve, the valves open (or on 'b'), and the valves ever flipped, see add_valve
+        self.valve_bits = {}
+        self.valve_states = 0
+        self.flipped_valves = 0
+        # Topologies of the last valve configurations, by valve state code
+        self.topologies = OrderedDict()
+
+    def add_controller_box(self, cb):
+        self.controller_boxes[cb.get_name()] = cb
+
+    def bump_state_version(self):
+        with self.lock.write():
+            self.state_version = self.state_version + 1
+
+    '''
+        Gives every valve of the gashouse a bit, set while the valve is open (or on 'b' for three way valves).
+        The graph also keeps edges from the neighbors a valve had before its first flip, so a second mask
+        records the valves that were ever flipped. Together they identify the topology of the gashouse.
+    '''
+    def add_valve(self, name, valve):
+        self.valve_bits[name] = len(self.valve_bits)
+        self.record_valve_state(name, valve, flipped=False)
+
+    def record_valve_state(self, name, valve, flipped=True):
+        bit = self.valve_bits[name]
+        if valve.get_reading() in ['open', 'b']:
+            self.valve_states = self.valve_states | 1 << bit
+        else:
+            self.valve_states = self.valve_states & ~(1 << bit)
+        if flipped:
+            self.flipped_valves = self.flipped_valves | 1 << bit
+
+    '''
+        Bitmask of the valve states, equal codes mean equal topologies
+    '''
+    def get_valve_state_code(self) -> int:
+        return self.valve_states | self.flipped_valves << len(self.valve_bits)
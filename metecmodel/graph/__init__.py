@@ -1,2 +1,3 @@
 from .graphnode import GraphNode
 from .pnidgraph import PNIDGraph
+from .compactpnidgraph import CompactPNIDGraph
@@ -0,0 +1,138 @@
+import threading
+
+
+class CompactPNIDGraph:
+
+    """
+        Same graph as PNIDGraph without networkx. Node names are interned to integer ids and the successors of
+        every node are a bitset (a python int, bit i set when there is an edge to node i), so a traversal is a
+        handful of integer ors over the frontier.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.successors = []
+        # Reachable bitset of every source id asked for so far, kept up to date as valves flip,
+        # and the names of those nodes for the sources asked for by name
+        self._reachable = {}
+        self._reachable_names = {}
+        self._lock = threading.RLock()
+
+    def _intern(self, node_name) -> int:
+        node_id = self.ids.get(node_name)
+        if node_id is None:
+            node_id = len(self.names)
+            self.ids[node_name] = node_id
+            self.names.append(node_name)
+            self.successors.append(0)
+        return node_id
+
+    def _add_edge(self, a, b):
+        self.successors[self._intern(a)] |= 1 << self._intern(b)
+
+    def _bits_to_names(self, bits):
+        names = []
+        while bits:
+            low = bits & -bits
+            names.append(self.names[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+    def add_node(self, node_name, neighbors):
+        with self._lock:
+            self._reachable.clear()
+            self._reachable_names.clear()
+            self._intern(node_name)
+            # make sure that flow is one way through flow meters
+            if 'FM' in node_name:
+                list(neighbors).sort()
+                self._add_edge(neighbors[0], node_name)
+                self._add_edge(node_name, neighbors[1])
+            elif 'VOL' not in node_name:
+                for n in neighbors:
+                    self._add_edge(node_name, n)
+                    self._add_edge(n, node_name)
+
+    '''
+        Breadth first search over bitsets, every round ors in the successors of the whole frontier
+    '''
+    def _reach(self, source_id) -> int:
+        reached = 1 << source_id
+        frontier = reached
+        while frontier:
+            next_frontier = 0
+            while frontier:
+                low = frontier & -frontier
+                next_frontier |= self.successors[low.bit_length() - 1]
+                frontier ^= low
+            frontier = next_frontier & ~reached
+            reached |= frontier
+        return reached
+
+    def _get_reachable(self, source_id) -> int:
+        reachable = self._reachable.get(source_id)
+        if reachable is None:
+            with self._lock:
+                reachable = self._reach(source_id)
+                self._reachable[source_id] = reachable
+        return reachable
+
+    def are_connected(self, a, b):
+        a_id, b_id = self.ids.get(a), self.ids.get(b)
+        if a_id is None or b_id is None:
+            return False
+        return self._get_reachable(a_id) >> b_id & 1 == 1
+
+    '''
+        Every node that has a path from source, source included. Empty if source is not in the graph.
+    '''
+    def reachable_from(self, source) -> frozenset:
+        source_id = self.ids.get(source)
+        if source_id is None:
+            return frozenset()
+        names = self._reachable_names.get(source_id)
+        if names is None:
+            with self._lock:
+                names = frozenset(self._bits_to_names(self._get_reachable(source_id)))
+                self._reachable_names[source_id] = names
+        return names
+
+    def edges(self, node_name):
+        node_id = self.ids.get(node_name)
+        if node_id is None:
+            return []
+        return [(node_name, n) for n in self._bits_to_names(self.successors[node_id])]
+
+    '''
+        Same index maintenance as PNIDGraph.redraw_edges, only sources that reach the flipped node or one of its
+        new neighbors are recomputed.
+    '''
+    def redraw_edges(self, node_name, new_neighbors):
+        with self._lock:
+            changed = 0
+            for n in [node_name] + list(new_neighbors):
+                changed |= 1 << self._intern(n)
+            for source_id, bits in list(self._reachable.items()):
+                if bits & changed:
+                    del self._reachable[source_id]
+                    self._reachable_names.pop(source_id, None)
+            self.successors[self.ids[node_name]] = 0
+            for n in new_neighbors:
+                self._add_edge(node_name, n)
+                self._add_edge(n, node_name)
+
+    def nodes(self):
+        return list(self.names)
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def save_graph(self, graph_file):
+        import networkx as nx
+        with self._lock:
+            graph = nx.DiGraph()
+            graph.add_nodes_from(self.names)
+            for node_name in self.names:
+                graph.add_edges_from(self.edges(node_name))
+            nx.write_gml(graph, graph_file)
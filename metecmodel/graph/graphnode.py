@@ -1,8 +1,13 @@
+import sys
+
 
 class GraphNode:
 
+    # name and neighbors are slots of the components, which also derive from ComponentBaseClass
+    __slots__ = ()
+
     def __init__(self, name, neighbors):
-        self.name = name
+        self.name = sys.intern(name)
         self.neighbors = neighbors
 
     def get_neighbors(self):
@@ -1,36 +1,80 @@
 import networkx as nx
+import threading
 
 
 class PNIDGraph:
 
     def __init__(self):
         self.graph = nx.DiGraph()
+        # Reachable nodes of every source asked for so far, kept up to date as valves flip
+        self._reachable = {}
+        self._lock = threading.RLock()
 
     def add_node(self, node_name, neighbors):
-        self.graph.add_node(node_name)
-        # make sure that flow is one way through flow meters
-        if 'FM' in node_name:
-            list(neighbors).sort()
-            self.graph.add_edge(neighbors[0], node_name)
-            self.graph.add_edge(node_name, neighbors[1])
-        elif 'VOL' not in node_name:
-            for n in neighbors:
-                self.graph.add_edge(node_name, n)
-                self.graph.add_edge(n, node_name)
+        with self._lock:
+            self._reachable.clear()
+            self.graph.add_node(node_name)
+            # make sure that flow is one way through flow meters
+            if 'FM' in node_name:
+                list(neighbors).sort()
+                self.graph.add_edge(neighbors[0], node_name)
+                self.graph.add_edge(node_name, neighbors[1])
+            elif 'VOL' not in node_name:
+                for n in neighbors:
+                    self.graph.add_edge(node_name, n)
+                    self.graph.add_edge(n, node_name)
 
     def are_connected(self, a, b):
-        try:
-            return nx.has_path(self.graph, a, b)
-        except nx.exception.NodeNotFound:
-            return False
+        return b in self.reachable_from(a)
+
+    '''
+        Every node that has a path from source, source included. Empty if source is not in the graph.
+        Results are indexed by source and only recomputed after an edge change that can affect them.
+    '''
+    def reachable_from(self, source) -> frozenset:
+        reachable = self._reachable.get(source)
+        if reachable is not None:
+            return reachable
+        with self._lock:
+            if source not in self.graph:
+                return frozenset()
+            reachable = nx.descendants(self.graph, source)
+            reachable.add(source)
+            reachable = frozenset(reachable)
+            self._reachable[source] = reachable
+            return reachable
+
+    '''
+        Removing edges out of node_name can only shrink the reach of sources that reach node_name, and the new
+        edges can only grow the reach of sources that reach node_name or one of its new neighbors.
+        Every other indexed source is unaffected and kept.
+    '''
+    def _invalidate(self, changed_nodes):
+        for source, reachable in list(self._reachable.items()):
+            if not reachable.isdisjoint(changed_nodes):
+                del self._reachable[source]
 
     def redraw_edges(self, node_name, new_neighbors):
-        for edge in list(self.graph.edges(node_name)):
-            v = edge[1]
-            self.graph.remove_edge(node_name, v)
-        for n in new_neighbors:
-            self.graph.add_edge(node_name, n)
-            self.graph.add_edge(n, node_name)
+        with self._lock:
+            self._invalidate([node_name] + list(new_neighbors))
+            for edge in list(self.graph.edges(node_name)):
+                v = edge[1]
+                self.graph.remove_edge(node_name, v)
+            for n in new_neighbors:
+                self.graph.add_edge(node_name, n)
+                self.graph.add_edge(n, node_name)
+
+    def edges(self, node_name):
+        if node_name not in self.graph:
+            return []
+        return list(self.graph.edges(node_name))
+
+    def nodes(self):
+        return list(self.graph.nodes)
+
+    def number_of_nodes(self):
+        return self.graph.number_of_nodes()
 
     def save_graph(self, graph_file):
-        nx.write_gml(self.graph, graph_file)
+        with self._lock:
+            nx.write_gml(self.graph, graph_file)
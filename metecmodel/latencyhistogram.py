@@ -0,0 +1,79 @@
+import math
+
+"""
+    Log bucketed latency histogram in the style of HdrHistogram. Latencies are counted in microseconds,
+    below 2^SUB_BUCKET_BITS every microsecond has its own bucket, above that every power of two is split into
+    2^(SUB_BUCKET_BITS - 1) buckets, so percentiles are within 1/2^(SUB_BUCKET_BITS - 1) of the recorded values
+    at any scale. Recording is a couple of integer operations and histograms of different threads merge by adding
+    their bucket counts.
+"""
+
+
+class LatencyHistogram:
+
+    SUB_BUCKET_BITS = 7
+    PERCENTILES = [('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999)]
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket_index(value) -> int:
+        bits = LatencyHistogram.SUB_BUCKET_BITS
+        if value < 1 << bits:
+            return value
+        shift = value.bit_length() - bits
+        return (1 << bits) + (shift - 1) * (1 << (bits - 1)) + (value >> shift) - (1 << (bits - 1))
+
+    '''
+        Largest value counted in the bucket
+    '''
+    @staticmethod
+    def bucket_value(index) -> int:
+        bits = LatencyHistogram.SUB_BUCKET_BITS
+        if index < 1 << bits:
+            return index
+        shift, top = divmod(index - (1 << bits), 1 << (bits - 1))
+        shift = shift + 1
+        return ((top + (1 << (bits - 1)) + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1000000))
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count = self.count + 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        # list() copies the buckets at once, other may be recording on its own thread
+        for index, count in list(other.counts.items()):
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count = self.count + other.count
+        self.max = max(self.max, other.max)
+
+    '''
+        Latency in seconds that a fraction q of the recorded latencies are at or below, 0 if nothing was recorded
+    '''
+    def get_percentile(self, q) -> float:
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen = seen + self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_value(index), self.max) / 1000000
+        return self.max / 1000000
+
+    '''
+        Count, percentiles and max, latencies in milliseconds
+    '''
+    def get_summary(self):
+        summary = {'count': self.count}
+        for name, q in self.PERCENTILES:
+            summary[name + '_ms'] = self.get_percentile(q) * 1000
+        summary['max_ms'] = self.max / 1000
+        return summary
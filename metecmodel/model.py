@@ -1,35 +1,75 @@
-from metecmodel import SensorPropertiesParser, ParseMultipleVolumes, ControllerBox
+from metecmodel import SensorPropertiesParser, ParseMultipleVolumes, ControllerBox, EmissionsTable, EmissionsBatch
 from metecmodel.components import *
 from typing import Dict, List
 from interfaces import ModelBaseClass, ComponentBaseClass
 from logger import Logger
-from metecmodel.graph import PNIDGraph
+from metecmodel.graph import PNIDGraph, CompactPNIDGraph
+from metecmodel.gashousepartition import GashousePartition
+from metecmodel.singleflight import SingleFlight
+from metecmodel.sensorstatestore import SensorStateStore
 import threading
 
 
 class Model(ModelBaseClass):
 
+    # P&ID graph implementations, 'compact' interns node names and keeps adjacency in bitsets
+    GRAPH_BACKENDS = {'networkx': PNIDGraph, 'compact': CompactPNIDGraph}
+    VALVE_TYPES = ['ElectricValve', 'ThreeWayElectricValve', 'ManualValve']
+    # Valve configurations remembered per gashouse by _get_topology
+    MAX_TOPOLOGIES = 128
+
     def __init__(self, sensor_properties: str, volumes_files: List[str], gashouse_boxes: Dict,
-                 initial_pressure=20, initial_temperature=75, initial_flow=15, failures={}):
+                 initial_pressure=20, initial_temperature=75, initial_flow=15, failures={}, graph_backend='networkx'):
+        if graph_backend not in self.GRAPH_BACKENDS:
+            raise ValueError('Unknown graph backend {}, expected one of {}'
+                             .format(graph_backend, list(self.GRAPH_BACKENDS.keys())))
+        self.graph_backend = graph_backend
         self.initial_pressure = initial_pressure
         self.initial_temperature = initial_temperature
         self.initial_flow = initial_flow
         self.failures = failures
         self.gashouse_boxes = gashouse_boxes
+        # Gashouse of every controller box, the first gashouse listing a box wins
+        self._box_gashouses = {}
+        for gashouse, boxes in gashouse_boxes.items():
+            for box in boxes:
+                self._box_gashouses.setdefault(box, gashouse)
+        # Guards the partitions and the pressure/temperature settings, gashouse state is behind the read/write
+        # lock of its partition: queries share it, valve and setting changes and flow computations are exclusive
         self.lock = threading.RLock()
+        self.partitions: Dict[str, GashousePartition] = {}
+        self._flow_flights = SingleFlight()
+        # Pressure, temperature and flow of every sensor, grouped by gashouse
+        self.sensor_store = SensorStateStore()
+        # Every component by its interned full name and by its component id (index in component_list)
+        self.components: Dict[str, ComponentBaseClass] = {}
+        self.component_list: List[ComponentBaseClass] = []
         self.logger = Logger('ModelLogger-1', '../logger/logs/model_log.txt')
         print('Initializing model...')
         self._init_model(sensor_properties, volumes_files)
+        self._init_valve_states()
         print('Model constructed')
 
     def _get_gashouse(self, name):
         prefix = name.split('.')[0]
         if 'GSH' in prefix:
             return prefix
-        for gashouse in self.gashouse_boxes.keys():
-            if prefix in self.gashouse_boxes[gashouse]:
-                return gashouse
-        return prefix
+        return self._box_gashouses.get(prefix, prefix)
+
+    '''
+        The partition of the gashouse a component, node or controller box belongs to.
+        None if that gashouse has nothing in the model, unless create is set.
+    '''
+    def _get_partition(self, name, create=False) -> GashousePartition:
+        gashouse = self._get_gashouse(name)
+        partition = self.partitions.get(gashouse)
+        if partition is None and create:
+            with self.lock:
+                partition = self.partitions.get(gashouse)
+                if partition is None:
+                    partition = GashousePartition(gashouse, self.GRAPH_BACKENDS[self.graph_backend]())
+                    self.partitions[gashouse] = partition
+        return partition
 
     def _get_failures(self, name):
         failure_rate = 0
@@ -58,34 +98,40 @@ class Model(ModelBaseClass):
         elif info['item_type'] == 'Pressure Transducer':
             pressure = self.get_gas_house_pressure(name)
             component = PressureTransducer(name, neighbors, info, initial_pressure=pressure,
-                                           failure_rate=failure_rate, failure_type=failure_type)
+                                           failure_rate=failure_rate, failure_type=failure_type,
+                                           store=self.sensor_store, group=self._get_gashouse(name))
         elif info['item_type'] == 'Thermocouple':
             temperature = self.get_gas_house_temperature(name)
             component = Thermocouple(name, neighbors, info, initial_temp=temperature,
-                                     failure_rate=failure_rate, failure_type=failure_type)
+                                     failure_rate=failure_rate, failure_type=failure_type,
+                                     store=self.sensor_store, group=self._get_gashouse(name))
         elif info['item_type'] == 'Flow Meter':
             component = FlowMeter(name, neighbors, info, initial_flow=self.initial_flow,
-                                  failure_rate=failure_rate, failure_type=failure_type)
+                                  failure_rate=failure_rate, failure_type=failure_type,
+                                  store=self.sensor_store, group=self._get_gashouse(name))
         elif info['item_type'] == 'Manual Valve':
             if 'a' in neighbors:
                 component = ManualValve(name, neighbors, info, initial_state='a')
             else:
                 component = ManualValve(name, neighbors, info, initial_state='open')
         else:
-            self.logger.warning('Unknown type for component {}'.format(name))
+            self.logger.warning('Unknown type for component {}', name)
             return None
+        component.component_id = len(self.component_list)
+        self.component_list.append(component)
+        self.components[component.get_full_name()] = component
         return component
 
     def _init_graph(self, volumes):
-        self.graph = PNIDGraph()
         for item, neighbors in volumes.items():
+            graph = self._get_partition(item, create=True).graph
             # If there is a component use that to add to the graph
             try:
                 component = self.get_component(item)
             except KeyError:
                 component = None
             if component:
-                self.graph.add_node(component.get_full_name(), component.get_neighbors())
+                graph.add_node(component.get_full_name(), component.get_neighbors())
             else:
                 # If not add it manually, manual valves will be set to open by default
                 if 'MV' in item:
@@ -94,7 +140,7 @@ class Model(ModelBaseClass):
                     current_neighbors = valve.get_neighbors()
                 else:
                     current_neighbors = neighbors
-                self.graph.add_node(item, current_neighbors)
+                graph.add_node(item, current_neighbors)
 
     def _init_model(self, sensor_properties_file, volumes_files):
         print('Loading configuration files...')
@@ -111,63 +157,199 @@ class Model(ModelBaseClass):
                     cb = ControllerBox(component.get_prefix(), components={component.get_full_name(): component})
                     controller_boxes[component.get_prefix()] = cb
         self.controller_boxes = controller_boxes
+        for cb_name, cb in controller_boxes.items():
+            self._get_partition(cb_name, create=True).add_controller_box(cb)
         self._init_graph(items_to_dict)
 
+    def _init_valve_states(self):
+        for cb_name in sorted(self.controller_boxes.keys()):
+            components = self.controller_boxes[cb_name].components
+            for name in sorted(components.keys()):
+                if components[name].get_type() in self.VALVE_TYPES:
+                    self._get_partition(name).add_valve(name, components[name])
+
+    '''
+        Bitmask of the valve states of a gashouse (see GashousePartition.add_valve),
+        equal masks mean equal topologies
+    '''
+    def get_valve_state_code(self, gashouse) -> int:
+        partition = self.partitions.get(gashouse)
+        return partition.get_valve_state_code() if partition else 0
+
+    '''
+        Components are only added while the model is built, so lookups don't take any lock
+    '''
     def get_component(self, name: str) -> ComponentBaseClass:
-        with self.lock:
-            prefix = name.split('.')[0]
-            if prefix in self.controller_boxes:
-                cb: ControllerBox = self.controller_boxes[prefix]
-                return cb.get_component(name)
-            else:
-                raise KeyError('{} not in model'.format(name))
+        component = self.components.get(name)
+        if component is None:
+            raise KeyError('{} not in model'.format(name))
+        return component
+
+    def get_component_by_id(self, component_id: int) -> ComponentBaseClass:
+        if not 0 <= component_id < len(self.component_list):
+            raise KeyError('No component with id {} in model'.format(component_id))
+        return self.component_list[component_id]
 
     def get_controller_box_emissions(self, cb_name) -> List[float]:
-        with self.lock:
-            self.logger.debug('Request for emissions on controller box {}'.format(cb_name))
-            if cb_name in self.controller_boxes:
-                cb: ControllerBox = self.controller_boxes[cb_name]
-                return cb.get_emissions(self.get_gas_house_pressure(cb_name))
-            else:
-                raise KeyError('{} not in model'.format(cb_name))
+        self.logger.debug('Request for emissions on controller box {}', cb_name)
+        partition = self._get_partition(cb_name)
+        if partition is None or cb_name not in partition.controller_boxes:
+            raise KeyError('{} not in model'.format(cb_name))
+        with partition.lock.read():
+            cb: ControllerBox = partition.controller_boxes[cb_name]
+            return cb.get_emissions(self.get_gas_house_pressure(cb_name))
+
+    '''
+        Total emissions of every controller box in a gashouse. The rows of all the boxes are evaluated
+        together by one EmissionsBatch, built the first time the gashouse is asked for.
+    '''
+    def get_gashouse_emissions(self, gashouse) -> Dict[str, float]:
+        self.logger.debug('Request for emissions on gashouse {}', gashouse)
+        partition = self.partitions.get(gashouse)
+        if partition is None:
+            raise KeyError('{} not in model'.format(gashouse))
+        rows = []
+        for box in self.gashouse_boxes[gashouse]:
+            if box not in partition.controller_boxes:
+                raise KeyError('{} not in model'.format(box))
+        with partition.lock.read():
+            for box in self.gashouse_boxes[gashouse]:
+                for valve_states, file in partition.controller_boxes[box].get_row_valve_states():
+                    rows.append((box, valve_states, file))
+            box_emissions = {box: 0 for box in self.gashouse_boxes[gashouse]}
+            if not rows:
+                return box_emissions
+            if partition.emissions_batch is None:
+                partition.emissions_batch = EmissionsBatch([EmissionsTable.load(ControllerBox.EMISSIONS_DIRECTORY
+                                                                                + file) for _, _, file in rows])
+            emissions = partition.emissions_batch.get_emissions([self.get_gas_house_pressure(box)
+                                                                 for box, _, _ in rows],
+                                                                [valve_states for _, valve_states, _ in rows])
+            for (box, _, _), em in zip(rows, emissions.tolist()):
+                box_emissions[box] = box_emissions[box] + em
+            return box_emissions
+
+    def get_state_version(self, gashouse) -> int:
+        partition = self.partitions.get(gashouse)
+        return partition.state_version if partition else 0
 
     def set_valve(self, name, value) -> str:
-        with self.lock:
+        partition = self._get_partition(name)
+        if partition is None:
+            raise KeyError('{} not in model'.format(name))
+        with partition.lock.write():
             valve = self.get_component(name)
             if valve.get_type == 'ThreeWayElectricValve':
                 value = 'b' if value == 'open' else 'a'
             if value != valve.get_reading():
                 valve.flip_valve()
-                self.logger.info('Flipping valve {} now {}'.format(name, valve.get_reading()))
-                self.graph.redraw_edges(name, valve.get_neighbors())
+                self.logger.info('Flipping valve {} now {}', name, valve.get_reading())
+                partition.graph.redraw_edges(name, valve.get_neighbors())
+                if name in partition.valve_bits:
+                    partition.record_valve_state(name, valve)
+                partition.bump_state_version()
             return valve.get_reading()
 
+    '''
+        Piping never crosses gashouses, nodes in different partitions are never connected
+    '''
     def are_connected(self, node_a, node_b) -> bool:
-        return self.graph.are_connected(node_a, node_b)
+        partition = self._get_partition(node_a)
+        if partition is None or partition is not self._get_partition(node_b):
+            return False
+        return partition.graph.are_connected(node_a, node_b)
+
+    def get_edges(self, node_name):
+        partition = self._get_partition(node_name)
+        return partition.graph.edges(node_name) if partition else []
+
+    def number_of_nodes(self):
+        return sum(partition.graph.number_of_nodes() for partition in self.partitions.values())
+
+    '''
+        Writes the graphs of every gashouse as one graph
+    '''
+    def save_graph(self, graph_file):
+        import networkx as nx
+        graph = nx.DiGraph()
+        for partition in self.partitions.values():
+            with partition.lock.read():
+                for node_name in partition.graph.nodes():
+                    graph.add_node(node_name)
+                    graph.add_edges_from(partition.graph.edges(node_name))
+        nx.write_gml(graph, graph_file)
 
+    '''
+        The flow meters reachable from the gashouse inlet, in order, and the controller boxes every one of them
+        reaches. Remembered for the last MAX_TOPOLOGIES valve configurations of the gashouse, so going back to
+        a configuration seen before skips the graph.
+    '''
+    def _get_topology(self, gashouse):
+        partition = self.partitions[gashouse]
+        with partition.lock.write():
+            topologies = partition.topologies
+            code = partition.get_valve_state_code()
+            topology = topologies.get(code)
+            if topology is not None:
+                topologies.move_to_end(code)
+                return topology
+            connected_meters = []
+            meter_boxes = {}
+            # one traversal from the gashouse inlet and one from every connected meter
+            inlet_reachable = partition.graph.reachable_from(gashouse + '.VOL-0')
+            for meter in self.gashouse_boxes[gashouse + '_FM']:
+                if gashouse + '.' + meter in inlet_reachable:
+                    if meter not in connected_meters:
+                        connected_meters.append(meter)
+                    # The graph is softly directional so order does matter
+                    meter_reachable = partition.graph.reachable_from(gashouse + '.' + meter)
+                    meter_boxes[meter] = [box for box in self.gashouse_boxes[gashouse]
+                                          if box + '.VOL-1' in meter_reachable]
+            topology = (connected_meters, meter_boxes)
+            topologies[code] = topology
+            if len(topologies) > self.MAX_TOPOLOGIES:
+                topologies.popitem(last=False)
+            return topology
+
+    '''
+        Flows of every flow meter in the gashouse. Flows are cached against the state version of the gashouse,
+        so they are only recomputed after a valve, pressure or temperature change. Concurrent requests for the
+        same gashouse state wait for one computation and share its result.
+    '''
     def calculate_flows(self, gashouse) -> Dict:
-        with self.lock:
-            self.logger.debug('Requesting flows for {}'.format(gashouse))
-            if gashouse not in self.gashouse_boxes:
-                return {}
+        self.logger.debug('Requesting flows for {}', gashouse)
+        if gashouse not in self.gashouse_boxes:
+            return {}
+        partition = self.partitions.get(gashouse)
+        version = self.get_state_version(gashouse)
+        cached = partition.flow_cache if partition else None
+        if cached and cached[0] == version:
+            return dict(cached[1])
+        return dict(self._flow_flights.do((gashouse, version), self._calculate_flows, gashouse))
+
+    def _calculate_flows(self, gashouse) -> Dict:
+        partition = self.partitions.get(gashouse)
+        if partition is None:
+            raise KeyError('{} not in model'.format(gashouse))
+        with partition.lock.write():
+            # the state may have changed, or been computed by another flight, while waiting for the lock
+            version = partition.state_version
+            cached = partition.flow_cache
+            if cached and cached[0] == version:
+                return cached[1]
             gsh_boxes = self.gashouse_boxes[gashouse]
             gsh_flow_meters = self.gashouse_boxes[gashouse + '_FM']
-            connected_meters = []
             flow_dict = {}
             total_emissions = 0
+            emissions = self.get_gashouse_emissions(gashouse)
             for box in gsh_boxes:
-                total_emissions = total_emissions + sum(self.get_controller_box_emissions(box))
+                total_emissions = total_emissions + emissions[box]
             total_emissions_in_slpm = total_emissions * 0.47
+            connected_meters, meter_boxes = self._get_topology(gashouse)
             for meter in gsh_flow_meters:
                 meter_emissions = 0
-                if self.are_connected(gashouse + '.VOL-0', gashouse + '.' + meter):
-                    if meter not in connected_meters:
-                        connected_meters.append(meter)
-                    for box in gsh_boxes:
-                        box_emissions = sum(self.get_controller_box_emissions(box))
-                        # The graph is softly directional so order does matter
-                        if self.are_connected(gashouse + '.' + meter, box + '.VOL-1'):
-                            meter_emissions = meter_emissions + box_emissions
+                for box in meter_boxes.get(meter, []):
+                    meter_emissions = meter_emissions + emissions[box]
                 meter_emissions_in_slpm = meter_emissions * 0.47
                 flow_dict[gashouse + '.' + meter] = meter_emissions_in_slpm
             new_dict = flow_dict.copy()
@@ -181,25 +363,48 @@ class Model(ModelBaseClass):
             for meter in gsh_flow_meters:
                 component = self.get_component(gashouse + '.' + meter)
                 component.flow = flow_dict[gashouse + '.' + meter]
-            self.logger.debug('Returning flows {}'.format(flow_dict))
-            self.logger.debug('Total Emissions {}'.format(total_emissions_in_slpm))
+            self.logger.debug('Returning flows {}', flow_dict)
+            self.logger.debug('Total Emissions {}', total_emissions_in_slpm)
+            partition.flow_cache = (version, flow_dict)
             return flow_dict
 
+    '''
+        Per gashouse settings only change that gashouse, a single setting for every gashouse changes them all.
+        Versions are bumped after the setting changed, under the partition lock, so no flows computed from the
+        old setting are cached against the new version.
+    '''
+    def _bump_changed_gashouses(self, setting, gashouse):
+        if type(setting) == dict:
+            changed = [self.partitions.get(gashouse)]
+        else:
+            changed = list(self.partitions.values())
+        for partition in changed:
+            if partition:
+                partition.bump_state_version()
+
     def change_model_pressure(self, new_pressure, gashouse):
-        self.initial_pressure = new_pressure
-        for name, cb in self.controller_boxes.items():
-            if self._get_gashouse(name) == gashouse:
-                for _, component in cb.components.items():
-                    if component.get_type() is 'PressureTransducer':
-                        component.pressure = new_pressure
+        with self.lock:
+            if type(self.initial_pressure) == dict:
+                self.initial_pressure = {**self.initial_pressure, gashouse: new_pressure}
+            else:
+                self.initial_pressure = new_pressure
+            self._bump_changed_gashouses(self.initial_pressure, gashouse)
+        partition = self.partitions.get(gashouse)
+        if partition:
+            with partition.lock.write():
+                self.sensor_store.set_group_value(gashouse, SensorStateStore.PRESSURE, new_pressure)
 
     def change_model_temperature(self, new_temp, gashouse):
-        self.initial_temperature = new_temp
-        for name, cb in self.controller_boxes.items():
-            if self._get_gashouse(name) == gashouse:
-                for _, component in cb.components.items():
-                    if component.get_type() is 'Thermocouple':
-                        component.temperature = new_temp
+        with self.lock:
+            if type(self.initial_temperature) == dict:
+                self.initial_temperature = {**self.initial_temperature, gashouse: new_temp}
+            else:
+                self.initial_temperature = new_temp
+            self._bump_changed_gashouses(self.initial_temperature, gashouse)
+        partition = self.partitions.get(gashouse)
+        if partition:
+            with partition.lock.write():
+                self.sensor_store.set_group_value(gashouse, SensorStateStore.TEMPERATURE, new_temp)
 
     def get_gas_house_pressure(self, name):
         pressure = self.initial_pressure
@@ -0,0 +1,76 @@
+import threading
+from contextlib import contextmanager
+
+"""
+    Lock shared by any number of readers or held by one writer. Waiting writers go before new readers so
+    valve writes are not starved by pollers. Both sides are reentrant, and the writer can also read.
+"""
+
+
+class ReadWriteLock:
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def _read_depth(self):
+        return getattr(self._local, 'depth', 0)
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        depth = self._read_depth()
+        with self._condition:
+            if self._writer != me and depth == 0:
+                while self._writer is not None or self._writers_waiting:
+                    self._condition.wait()
+            self._readers = self._readers + 1
+        self._local.depth = depth + 1
+
+    def release_read(self):
+        self._local.depth = self._read_depth() - 1
+        with self._condition:
+            self._readers = self._readers - 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth = self._writer_depth + 1
+                return
+            if self._read_depth():
+                raise RuntimeError('Cannot upgrade a read lock to a write lock')
+            self._writers_waiting = self._writers_waiting + 1
+            while self._writer is not None or self._readers:
+                self._condition.wait()
+            self._writers_waiting = self._writers_waiting - 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._condition:
+            self._writer_depth = self._writer_depth - 1
+            if self._writer_depth == 0:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,80 @@
+import numpy as np
+
+"""
+    Columnar state of every sensor in the model. Pressure transducers, thermocouples and flow meters only keep
+    an id into these arrays, so gashouse wide updates are single NumPy operations.
+"""
+
+
+class SensorStateStore:
+
+    PRESSURE = 0
+    TEMPERATURE = 1
+    FLOW = 2
+    FAILURE_TYPES = [None, 'random', 'dead', 'NaN']
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.group = np.zeros(capacity, dtype=np.int32)
+        self.pressure = np.zeros(capacity)
+        self.temperature = np.zeros(capacity)
+        self.flow = np.zeros(capacity)
+        self.slope = np.ones(capacity)
+        self.offset = np.zeros(capacity)
+        self.failure_rate = np.zeros(capacity)
+        self.failure_type = np.zeros(capacity, dtype=np.int8)
+        # group (gashouse) names to their index, and the ids of every (group, kind) for vectorized updates
+        self.groups = {}
+        self._members = {}
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self.kind))
+        for column in ['kind', 'group', 'pressure', 'temperature', 'flow', 'slope', 'offset', 'failure_rate',
+                       'failure_type']:
+            old = getattr(self, column)
+            new = np.ones(capacity, dtype=old.dtype) if column == 'slope' else np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+
+    '''
+        Adds a sensor of the given kind and returns its id. group is the gashouse it is updated with.
+    '''
+    def add(self, kind, group=None, value=0, slope=1, offset=0, failure_rate=0, failure_type=None) -> int:
+        if self.size == len(self.kind):
+            self._grow()
+        sid = self.size
+        self.size = self.size + 1
+        group_id = self.groups.setdefault(group, len(self.groups))
+        self.kind[sid] = kind
+        self.group[sid] = group_id
+        self.value_column(kind)[sid] = value
+        self.slope[sid] = slope
+        self.offset[sid] = offset
+        self.failure_rate[sid] = failure_rate
+        self.failure_type[sid] = self.FAILURE_TYPES.index(failure_type)
+        self._members.pop((group_id, kind), None)
+        return sid
+
+    def value_column(self, kind) -> np.ndarray:
+        if kind == self.PRESSURE:
+            return self.pressure
+        if kind == self.TEMPERATURE:
+            return self.temperature
+        return self.flow
+
+    def get_failure_type(self, sid):
+        return self.FAILURE_TYPES[self.failure_type[sid]]
+
+    def members(self, group, kind) -> np.ndarray:
+        group_id = self.groups.get(group)
+        if group_id is None:
+            return np.zeros(0, dtype=np.int64)
+        members = self._members.get((group_id, kind))
+        if members is None:
+            members = np.flatnonzero((self.group[:self.size] == group_id) & (self.kind[:self.size] == kind))
+            self._members[(group_id, kind)] = members
+        return members
+
+    def set_group_value(self, group, kind, value):
+        self.value_column(kind)[self.members(group, kind)] = value
@@ -0,0 +1,51 @@
+from threading import Lock, Event
+
+"""
+    Coalesces concurrent calls for the same key. The first caller runs the function, callers arriving
+    while it is in progress wait for it and share its result (or exception) instead of running it again.
+"""
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+
+    def do(self, key, function, *args):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                flight.waiters = flight.waiters + 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function(*args)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
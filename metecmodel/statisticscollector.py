@@ -1,116 +1,210 @@
 from threading import RLock
+from metecmodel.latencyhistogram import LatencyHistogram
+import threading
 import json
 
 
+class _CounterShard:
+
+    """
+        Counters of a single thread. Only the owning thread writes them, so incrementing takes no lock,
+        shards are summed up when the stats are read.
+    """
+    __slots__ = ('thread', 'generation', 'packets_received', 'responses_sent', 'error_packets_sent', 'socket_errors',
+                 'number_of_devices', 'response_time_total', 'response_count', 'latencies')
+
+    def __init__(self, thread=None, generation=0):
+        self.thread = thread
+        self.generation = generation
+        self.packets_received = 0
+        self.responses_sent = 0
+        self.error_packets_sent = 0
+        self.socket_errors = 0
+        self.number_of_devices = 0
+        self.response_time_total = 0
+        self.response_count = 0
+        # Response time histograms by (port, function code)
+        self.latencies = {}
+
+    def merge(self, other: '_CounterShard'):
+        self.packets_received = self.packets_received + other.packets_received
+        self.responses_sent = self.responses_sent + other.responses_sent
+        self.error_packets_sent = self.error_packets_sent + other.error_packets_sent
+        self.socket_errors = self.socket_errors + other.socket_errors
+        self.number_of_devices = self.number_of_devices + other.number_of_devices
+        self.response_time_total = self.response_time_total + other.response_time_total
+        self.response_count = self.response_count + other.response_count
+        for key, histogram in list(other.latencies.items()):
+            if key not in self.latencies:
+                self.latencies[key] = LatencyHistogram()
+            self.latencies[key].merge(histogram)
+
+
 class StatisticsCollector:
 
-    packets_received = 0
-    responses_sent = 0
-    error_packets_sent = 0
-    socket_errors = 0
-    number_of_devices = 0
-    avg_response_time = 0
-    number_of_terms_in_mean = 0
+    # Every thread counts in its own shard, the lock only guards the list of shards
     lock = RLock()
+    _shards = []
+    # Counts of threads that are done, folded together so the shard list does not grow with every connection
+    _retired = _CounterShard()
+    _local = threading.local()
+    # Bumped by reset, threads holding a shard of an older generation get a new one
+    _generation = 0
 
-    # def __init__(StatisticsCollector):
-    #     StatisticsCollector.packets_received = 0
-    #     StatisticsCollector.responses_sent = 0
-    #     StatisticsCollector.error_packets_sent = 0
-    #     StatisticsCollector.socket_errors = 0
-    #     StatisticsCollector.number_of_devices = 0
-    #     StatisticsCollector.avg_response_time = 0
-    #     StatisticsCollector.number_of_terms_in_mean = 0
-    #     StatisticsCollector.lock = RLock()
     @staticmethod
-    def increment_packets_received():
+    def _get_shard() -> _CounterShard:
+        shard = getattr(StatisticsCollector._local, 'shard', None)
+        if shard is None or shard.generation != StatisticsCollector._generation:
+            with StatisticsCollector.lock:
+                shard = _CounterShard(threading.current_thread(), StatisticsCollector._generation)
+                StatisticsCollector._retire_shards()
+                StatisticsCollector._shards.append(shard)
+            StatisticsCollector._local.shard = shard
+        return shard
+
+    @staticmethod
+    def _retire_shards():
+        alive = []
+        for shard in StatisticsCollector._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                StatisticsCollector._retired.merge(shard)
+        StatisticsCollector._shards = alive
+
+    '''
+        Sum of the counters of every thread
+    '''
+    @staticmethod
+    def _merged() -> _CounterShard:
+        total = _CounterShard()
         with StatisticsCollector.lock:
-            StatisticsCollector.packets_received = StatisticsCollector.packets_received + 1
+            StatisticsCollector._retire_shards()
+            total.merge(StatisticsCollector._retired)
+            for shard in StatisticsCollector._shards:
+                total.merge(shard)
+        return total
+
+    '''
+        Starts counting from zero. Shards are swapped instead of cleared, they belong to the threads counting in them,
+        which switch to a fresh shard with their next count. A count racing the reset may still land in an old shard.
+    '''
+    @staticmethod
+    def reset():
+        with StatisticsCollector.lock:
+            StatisticsCollector._generation = StatisticsCollector._generation + 1
+            StatisticsCollector._shards = []
+            StatisticsCollector._retired = _CounterShard()
+
+    @staticmethod
+    def increment_packets_received():
+        shard = StatisticsCollector._get_shard()
+        shard.packets_received = shard.packets_received + 1
 
     @staticmethod
     def get_packets_received():
-        with StatisticsCollector.lock:
-            return StatisticsCollector.packets_received
+        return StatisticsCollector._merged().packets_received
 
     @staticmethod
     def increment_responses_sent():
-        with StatisticsCollector.lock:
-            StatisticsCollector.responses_sent = StatisticsCollector.responses_sent + 1
+        shard = StatisticsCollector._get_shard()
+        shard.responses_sent = shard.responses_sent + 1
 
     @staticmethod
     def get_responses_sent():
-        with StatisticsCollector.lock:
-            return StatisticsCollector.responses_sent
+        return StatisticsCollector._merged().responses_sent
 
     @staticmethod
     def increment_error_packets_sent():
-        with StatisticsCollector.lock:
-            StatisticsCollector.error_packets_sent = StatisticsCollector.error_packets_sent + 1
+        shard = StatisticsCollector._get_shard()
+        shard.error_packets_sent = shard.error_packets_sent + 1
 
     @staticmethod
     def get_error_packets_sent():
-        with StatisticsCollector.lock:
-            return StatisticsCollector.error_packets_sent
+        return StatisticsCollector._merged().error_packets_sent
 
     @staticmethod
     def increment_socket_errors():
-        with StatisticsCollector.lock:
-            StatisticsCollector.socket_errors = StatisticsCollector.socket_errors + 1
+        shard = StatisticsCollector._get_shard()
+        shard.socket_errors = shard.socket_errors + 1
 
     @staticmethod
     def get_socket_errors():
-        with StatisticsCollector.lock:
-            return StatisticsCollector.socket_errors
+        return StatisticsCollector._merged().socket_errors
 
     @staticmethod
     def increment_number_of_devices():
-        with StatisticsCollector.lock:
-            StatisticsCollector.number_of_devices = StatisticsCollector.number_of_devices + 1
+        shard = StatisticsCollector._get_shard()
+        shard.number_of_devices = shard.number_of_devices + 1
 
     @staticmethod
     def get_number_devices():
-        with StatisticsCollector.lock:
-            return StatisticsCollector.number_of_devices
+        return StatisticsCollector._merged().number_of_devices
 
+    '''
+        Records a response time in seconds, in the histograms of port and function_code if they are given
+    '''
     @staticmethod
-    def increment_avg_response(n):
-        with StatisticsCollector.lock:
-            StatisticsCollector.number_of_terms_in_mean = StatisticsCollector.number_of_terms_in_mean + 1
-            if StatisticsCollector.number_of_terms_in_mean == 0:
-                StatisticsCollector.avg_response_time = n
-            else:
-                StatisticsCollector.avg_response_time = round(StatisticsCollector.avg_response_time
-                                                              + ((n - StatisticsCollector.avg_response_time) /
-                                                                 StatisticsCollector.number_of_terms_in_mean), 3)
+    def increment_avg_response(n, port=None, function_code=None):
+        shard = StatisticsCollector._get_shard()
+        shard.response_time_total = shard.response_time_total + n
+        shard.response_count = shard.response_count + 1
+        histogram = shard.latencies.get((port, function_code))
+        if histogram is None:
+            histogram = LatencyHistogram()
+            shard.latencies[(port, function_code)] = histogram
+        histogram.record(n)
+
+    @staticmethod
+    def _average_response_time(total: _CounterShard):
+        if total.response_count == 0:
+            return 0
+        return total.response_time_total / total.response_count
+
+    '''
+        Response time percentiles of all responses, by port and by function code
+    '''
+    @staticmethod
+    def _latency_summary(total: _CounterShard):
+        overall = LatencyHistogram()
+        ports = {}
+        function_codes = {}
+        for (port, function_code), histogram in total.latencies.items():
+            overall.merge(histogram)
+            if port is not None:
+                ports.setdefault(port, LatencyHistogram()).merge(histogram)
+            if function_code is not None:
+                function_codes.setdefault(function_code, LatencyHistogram()).merge(histogram)
+        return {
+            'all': overall.get_summary(),
+            'ports': {port: ports[port].get_summary() for port in sorted(ports)},
+            'function_codes': {code: function_codes[code].get_summary() for code in sorted(function_codes)}
+        }
+
+    @staticmethod
+    def get_latencies():
+        return StatisticsCollector._latency_summary(StatisticsCollector._merged())
 
     @staticmethod
     def get_average_response_time():
-        with StatisticsCollector.lock:
-            return StatisticsCollector.avg_response_time
+        return StatisticsCollector._average_response_time(StatisticsCollector._merged())
 
     @staticmethod
     def write_out_stats(stats_file):
-        with StatisticsCollector.lock:
-            data = {
-                'packets_received': StatisticsCollector.packets_received,
-                'responses_sent': StatisticsCollector.responses_sent,
-                'error_packets_sent': StatisticsCollector.error_packets_sent,
-                'socket_errors': StatisticsCollector.error_packets_sent,
-                'average_response_time': StatisticsCollector.avg_response_time,
-                'number_of_devices': StatisticsCollector.number_of_devices
-            }
-            with open(stats_file, 'w') as f:
-                f.write(json.dumps(data))
-                f.close()
+        data = StatisticsCollector.get_stats()
+        with open(stats_file, 'w') as f:
+            f.write(json.dumps(data))
+            f.close()
 
     @ staticmethod
     def get_stats():
-        with StatisticsCollector.lock:
-            return {
-                'packets_received': StatisticsCollector.packets_received,
-                'responses_sent': StatisticsCollector.responses_sent,
-                'error_packets_sent': StatisticsCollector.error_packets_sent,
-                'socket_errors': StatisticsCollector.error_packets_sent,
-                'average_response_time': StatisticsCollector.avg_response_time,
-                'number_of_devices': StatisticsCollector.number_of_devices
-            }
\ No newline at end of file
+        total = StatisticsCollector._merged()
+        return {
+            'packets_received': total.packets_received,
+            'responses_sent': total.responses_sent,
+            'error_packets_sent': total.error_packets_sent,
+            'socket_errors': total.socket_errors,
+            'average_response_time': StatisticsCollector._average_response_time(total),
+            'number_of_devices': total.number_of_devices,
+            'latency': StatisticsCollector._latency_summary(total)
+        }
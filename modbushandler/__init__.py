@@ -2,3 +2,4 @@ from .modbusreceiver import ModbusReceiver
 from .modbusdecoder import *
 from .modbusencoder import *
 from .util import *
+from .asyncmodbusserver import AsyncModbusServer
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from typing import Callable
+from logger import Logger
+
+
+class AsyncModbusServer:
+
+    """
+        Owns a single asyncio event loop that serves the endpoints of any number of ModbusReceivers.
+        Instead of parking one thread per device in a blocking accept/recv, every receiver opens its socket
+        on this loop and requests are dispatched to the handler registered with it (usually LabJack.on_request).
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.receivers = []
+        self.started = threading.Event()
+        self.logger = Logger('AsyncServerLogger', '../logger/logs/server_log.txt')
+
+    async def _start_receiver(self, receiver, request_handler: Callable) -> None:
+        try:
+            await receiver.start_server_async(request_handler)
+        except OSError as e:
+            self.logger.warning('Could not start server on port {} {}', receiver.port, e)
+            receiver.error = e
+            receiver.done.set()
+
+    '''
+        (receiver, error) of every receiver whose endpoint could not be opened, complete once started is set
+    '''
+    def get_failed(self) -> list:
+        return [(receiver, receiver.error) for receiver, _ in self.receivers if receiver.error is not None]
+
+    '''
+        Registers a receiver with the server. Receivers added after serve_forever was called are started
+        on the running loop right away.
+    '''
+    def add_receiver(self, receiver, request_handler: Callable) -> None:
+        self.receivers.append((receiver, request_handler))
+        if self.started.is_set():
+            asyncio.run_coroutine_threadsafe(self._start_receiver(receiver, request_handler), self.loop)
+
+    '''
+        Opens every registered endpoint and runs the event loop until stop is called.
+        This blocks the calling thread, see main_program.ServerLoopThread.
+    '''
+    def serve_forever(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        for receiver, request_handler in self.receivers:
+            self.loop.run_until_complete(self._start_receiver(receiver, request_handler))
+        self.logger.info('Serving {} receivers on one event loop, {} failed to start', len(self.receivers),
+                         len(self.get_failed()))
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            for receiver, _ in self.receivers:
+                receiver.stop_server_async()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+
+    '''
+        Stops the loop from any thread, stopping a server that is already stopped does nothing
+    '''
+    def stop(self) -> None:
+        if self.loop.is_closed():
+            return
+        self.logger.info('Stopping async server now')
+        for receiver, _ in self.receivers:
+            receiver.stop.set()
+        self.loop.call_soon_threadsafe(self.loop.stop)
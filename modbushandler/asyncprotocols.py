@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import Callable
+from modbushandler.modbusframer import ModbusTcpFramer
+from metecmodel import StatisticsCollector
+
+"""
+    asyncio protocols used by ModbusReceiver.start_server_async. They mirror the blocking TCP and UDP loops
+    in ModbusReceiver, but are driven by a shared event loop so a single thread can serve every device.
+    Decoding and dispatching is left to the receiver, these classes only deal with transports and timing.
+"""
+
+
+class ModbusTcpProtocol(asyncio.Protocol):
+
+    def __init__(self, receiver, request_handler: Callable):
+        self.receiver = receiver
+        self.request_handler = request_handler
+        self.transport = None
+        self.framer = ModbusTcpFramer()
+        self.last_activity = time.monotonic()
+        self.idle_handle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.receiver.failures.get('disconnected', False) or not self.receiver.register_connection(transport):
+            transport.close()
+            return
+        self.receiver.logger.info('New connection accepted {}', transport.get_extra_info('peername'))
+        if self.receiver.idle_timeout:
+            self.idle_handle = asyncio.get_event_loop().call_later(self.receiver.idle_timeout, self._check_idle)
+
+    def connection_lost(self, exc):
+        self.receiver.unregister_connection(self.transport)
+        if self.idle_handle:
+            self.idle_handle.cancel()
+        if exc:
+            self.receiver.logger.warning('An IO error occurred when reading the socket {}', exc)
+            StatisticsCollector.increment_socket_errors()
+
+    def _check_idle(self):
+        idle_for = time.monotonic() - self.last_activity
+        if idle_for >= self.receiver.idle_timeout:
+            self.receiver.logger.info('MB:{} Connection idle for {}s, closing it', self.receiver.port,
+                                      self.receiver.idle_timeout)
+            self.transport.close()
+        else:
+            self.idle_handle = asyncio.get_event_loop().call_later(self.receiver.idle_timeout - idle_for,
+                                                                   self._check_idle)
+
+    def data_received(self, data):
+        self.last_activity = time.monotonic()
+        self.framer.feed(data)
+        try:
+            keep_open, results = self.receiver.process_frames(self.framer, self.request_handler)
+        except Exception as e:
+            self.receiver.logger.warning('MB:{} Request handler failed {}', self.receiver.port, e)
+            self.transport.close()
+            return
+        responses = self.receiver.apply_failures(results, asyncio.get_event_loop().call_later, self._send)
+        self._send(responses)
+        if not keep_open:
+            self.transport.close()
+
+    def _send(self, responses):
+        if not responses or self.transport.is_closing():
+            return
+        self.transport.write(b''.join(response for response, _, _, _ in responses))
+        for _, response_start, is_error, function_code in responses:
+            self.receiver.record_response(response_start, is_error, function_code)
+
+
+class ModbusUdpProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, receiver, request_handler: Callable):
+        self.receiver = receiver
+        self.request_handler = request_handler
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        self.receiver.logger.warning('An IO error occurred with the socket {}', exc)
+        StatisticsCollector.increment_socket_errors()
+
+    def datagram_received(self, data, address):
+        if self.receiver.failures.get('disconnected', False):
+            return
+        self.receiver.logger.debug('Message received from: {}', address)
+        try:
+            result = self.receiver.process_datagram(data, self.request_handler)
+        except Exception as e:
+            self.receiver.logger.warning('MB:{} Request handler failed {}', self.receiver.port, e)
+            return
+        if result is None:
+            return
+        (response_start, is_error, function_code), response = result
+        if not is_error:
+            should_respond, delay = self.receiver.get_failure_action()
+            if not should_respond:
+                return
+            if delay:
+                asyncio.get_event_loop().call_later(delay, self._send, response, address, response_start, False,
+                                                    function_code)
+                return
+        self._send(response, address, response_start, is_error, function_code)
+
+    def _send(self, response, address, response_start, is_error=False, function_code=None):
+        if self.transport.is_closing():
+            return
+        self.transport.sendto(response, address)
+        self.receiver.record_response(response_start, is_error, function_code)
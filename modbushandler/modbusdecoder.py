@@ -1,3 +1,4 @@
+import struct
 from typing import Dict
 
 """
@@ -6,15 +7,29 @@ from typing import Dict
     followed by the amount of registers to read.
     
     Write methods will send a starting register followed by a set of values to write into concurrent registers.
+
+    Every method reads fields in place with precompiled structs (unpack_from), so the packet data can be passed
+    as a memoryview over the receive buffer without copying it. Offset 0 of the data is the function code.
 """
 
+_HEADER = struct.Struct('>HHHB')
+_ADDRESS_AND_VALUE = struct.Struct('>HH')
+_ADDRESS_COUNT_AND_BYTES = struct.Struct('>HHB')
+_LENGTH = struct.Struct('>H')
+_register_structs = {}
+
+
+def _get_register_struct(count) -> struct.Struct:
+    register_struct = _register_structs.get(count)
+    if register_struct is None:
+        register_struct = _register_structs[count] = struct.Struct('>{}H'.format(count))
+    return register_struct
+
 
 def read_entity(data) -> (bool, Dict):
-    data = data[1:]
     is_error = False
 
-    address = (data[0] << 8) | (data[1])
-    count = (data[2] << 8) | (data[3])
+    address, count = _ADDRESS_AND_VALUE.unpack_from(data, 1)
 
     if address < 0:
         is_error = True
@@ -47,11 +62,9 @@ def read_input_registers(data):
 
 
 def write_entity(data) -> (bool, Dict):
-    data = data[1:]
     is_error = False
 
-    address = (data[0] << 8) | (data[1])
-    value = (data[2] << 8) | (data[3])
+    address, value = _ADDRESS_AND_VALUE.unpack_from(data, 1)
 
     if address < 0:
         is_error = True
@@ -76,13 +89,10 @@ def write_single_holding_register(data):
 
 
 def write_multiple_coils(data):
-    data = data[1:]
     is_error = False
 
-    first_coil = (data[0] << 8) | (data[1])
-    num_coils_to_write = (data[2] << 8) | (data[3])
-    num_bytes_of_coils = data[4]
-    coil_bytes = data[5:5 + num_bytes_of_coils]
+    first_coil, num_coils_to_write, num_bytes_of_coils = _ADDRESS_COUNT_AND_BYTES.unpack_from(data, 1)
+    coil_bytes = data[6:6 + num_bytes_of_coils]
     coil_values = [0] * (num_bytes_of_coils * 8)
     # Unpack the coil value hex into an array of on/off (1/0)
     for b in range(0, num_bytes_of_coils * 8):
@@ -108,17 +118,11 @@ def write_multiple_coils(data):
 
 
 def write_multiple_holding_registers(data):
-    data = data[1:]
     is_error = False
 
-    first_register = (data[0] << 8) | (data[1])
-    num_regs_to_write = (data[2] << 8) | (data[3])
-    num_bytes_of_registers = data[4]
-    register_values = [0] * (num_bytes_of_registers // 2)
+    first_register, num_regs_to_write, num_bytes_of_registers = _ADDRESS_COUNT_AND_BYTES.unpack_from(data, 1)
     # Each register value is 16 bits, decode every 2 bytes of data into one 16 bit value
-    for i in range(0, num_bytes_of_registers // 2):
-        idx = 5 + i * 2
-        register_values[i] = (data[idx] << 8) | (data[idx + 1])
+    register_values = list(_get_register_struct(num_bytes_of_registers // 2).unpack_from(data, 6))
 
     if first_register < 0:
         is_error = True
@@ -138,10 +142,7 @@ def write_multiple_holding_registers(data):
 def dissect_header(header_data):
     if len(header_data) < 7:
         return {'error': 'header is too short'}
-    transaction_id = (header_data[0] << 8) | (header_data[1])
-    protocol_id = (header_data[2] << 8) | (header_data[3])
-    length = (header_data[4] << 8) | (header_data[5])
-    unit_id = (header_data[6])
+    transaction_id, protocol_id, length, unit_id = _HEADER.unpack_from(header_data)
     return {
         'transaction_id': transaction_id,
         'protocol_id': protocol_id,
@@ -150,6 +151,13 @@ def dissect_header(header_data):
     }
 
 
+'''
+    Reads only the length field of an MBAP header, used by the framers to find the end of a frame.
+'''
+def header_length(header_data, offset=0) -> int:
+    return _LENGTH.unpack_from(header_data, offset + 4)[0]
+
+
 def invalid_function_code(data):
     code = data[0]
     is_error = True
@@ -1,6 +1,23 @@
 import struct
 from typing import Dict
 
+"""
+    Builds modbus responses. Each response layout (header, byte count and the data type of every register) is
+    compiled once into a struct.Struct and cached, so encoding a response is a single pack_into a preallocated
+    bytearray no matter how many registers are read.
+"""
+
+_REGISTER_FORMATS = {
+    'FLOAT32': 'f',
+    'INT32': 'i',
+    'UINT32': 'I',
+    'UINT16': 'H',
+    'UINT64': 'Q'
+}
+# transaction id, protocol id, length, unit id, function code
+_HEADER_FORMAT = 'HHHBB'
+_response_structs = {}
+
 
 # Set's all the needed fields or puts in default values
 def _get_header_contents_or_default(header) -> Dict:
@@ -16,50 +33,48 @@ def _get_header_contents_or_default(header) -> Dict:
     }
 
 
-def _pack_header(header, endian_char):
-    return struct.pack(endian_char + 'hhhbb', header['transaction_id'],
-                       header['protocol_id'], header['length'], header['unit_id'], header['function_code'])
+def _get_endian_char(endianness):
+    return '>' if endianness == 'BIG' else '<'
 
 
-def respond_read_registers(header, registers, endianness='BIG'):
-    endian_char = '>' if endianness == 'BIG' else '<'
-    # get header contents or default
-    header = _get_header_contents_or_default(header)
+def _get_read_response_struct(endian_char, dtypes) -> struct.Struct:
+    key = (endian_char, dtypes)
+    response_struct = _response_structs.get(key)
+    if response_struct is None:
+        register_format = ''.join(_REGISTER_FORMATS.get(dtype, 'H') for dtype in dtypes)
+        # the header is followed by the number of bytes of register data
+        response_struct = struct.Struct(endian_char + _HEADER_FORMAT + 'B' + register_format)
+        _response_structs[key] = response_struct
+    return response_struct
 
-    register_count = 0
-    for _, dtype in registers:
-        if '32' in dtype:
-            register_count = register_count + 32 // 8
-        elif '16' in dtype:
-            register_count = register_count + 16 // 8
-        else:
-            register_count = register_count + 8
 
-    header['length'] = 3 + register_count
+def _get_write_response_struct(endian_char) -> struct.Struct:
+    key = (endian_char, 'write')
+    response_struct = _response_structs.get(key)
+    if response_struct is None:
+        response_struct = _response_structs[key] = struct.Struct(endian_char + _HEADER_FORMAT + 'HH')
+    return response_struct
 
-    header = _pack_header(header, endian_char)
 
-    register_count = struct.pack(endian_char + 'b', register_count)
+def _pack_response(response_struct: struct.Struct, *values) -> bytearray:
+    response = bytearray(response_struct.size)
+    response_struct.pack_into(response, 0, *values)
+    return response
 
-    response = header + register_count
-    for register, dtype in registers:
-        if dtype == 'FLOAT32':
-            response += struct.pack(endian_char + 'f', register)
-        elif dtype == 'UINT16':
-            response += struct.pack(endian_char + 'H', register)
-        elif dtype == 'UINT32':
-            response += struct.pack(endian_char + 'I', register)
-        else:
-            response += struct.pack(endian_char + 'H', register)
 
-    return response
+def respond_read_registers(header, registers, endianness='BIG'):
+    header = _get_header_contents_or_default(header)
+    response_struct = _get_read_response_struct(_get_endian_char(endianness),
+                                                 tuple(dtype for _, dtype in registers))
+    # MBAP header (7 bytes) + function code + byte count come before the register data
+    register_count = response_struct.size - 9
+    return _pack_response(response_struct, header['transaction_id'], header['protocol_id'], 3 + register_count,
+                          header['unit_id'], header['function_code'], register_count,
+                          *[register for register, _ in registers])
 
 
 def respond_write_registers(header, start_register, num_registers, endianness='BIG'):
-    endian_char = '>' if endianness == 'BIG' else '<'
     header = _get_header_contents_or_default(header)
-    header['length'] = 6
-    header = _pack_header(header, endian_char)
-    body = struct.pack(endian_char + 'hh', start_register, num_registers)
-    return header + body
-
+    response_struct = _get_write_response_struct(_get_endian_char(endianness))
+    return _pack_response(response_struct, header['transaction_id'], header['protocol_id'], 6,
+                          header['unit_id'], header['function_code'], start_register, num_registers)
@@ -0,0 +1,70 @@
+from modbushandler import modbusdecoder
+
+"""
+    Splits a Modbus/TCP byte stream into MBAP frames. Socket reads go straight into one reusable buffer and
+    every complete frame in it is handed out, so clients that pipeline several transactions are served back to back
+    and short reads under load never cut a request in half.
+        MBAP header: transaction id (2), protocol id (2), length (2), unit id (1)
+        The length field counts the unit id plus the pdu (function code + data).
+"""
+
+
+class ModbusTcpFramer:
+
+    HEADER_SIZE = 7
+    # Largest Modbus/TCP ADU is 260 bytes, so the length field can be at most 254
+    MAX_LENGTH = 254
+
+    def __init__(self, buffer_size=4096):
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def _make_room(self) -> None:
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            # Move the trailing partial frame to the front of the buffer
+            pending = self.end - self.start
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+
+    '''
+        Reads as much as is available from the socket into the free space of the buffer.
+        Returns the number of bytes read, 0 means the peer closed the connection.
+    '''
+    def recv_from(self, connection) -> int:
+        self._make_room()
+        read = connection.recv_into(self.view[self.end:])
+        self.end = self.end + read
+        return read
+
+    def feed(self, data) -> None:
+        data = memoryview(data)
+        while len(data) > 0:
+            self._make_room()
+            chunk = min(len(data), len(self.buffer) - self.end)
+            self.view[self.end:self.end + chunk] = data[:chunk]
+            self.end = self.end + chunk
+            data = data[chunk:]
+
+    '''
+        Yields (header, pdu) for every complete frame in the buffer and leaves a trailing partial frame
+        for the next read. A frame with an empty pdu is the zero length header used to close the connection.
+        Both are memoryviews into the buffer, they are only valid until the next read so copy anything that has
+        to outlive the request. Raises a ValueError for a length field no Modbus device could send, the stream
+        can't be re-synced after that.
+    '''
+    def frames(self):
+        while self.end - self.start >= self.HEADER_SIZE:
+            length = modbusdecoder.header_length(self.view, self.start)
+            if length > self.MAX_LENGTH:
+                raise ValueError('Invalid MBAP length {}'.format(length))
+            frame_end = self.start + max(self.HEADER_SIZE, 6 + length)
+            if frame_end > self.end:
+                return
+            header = self.view[self.start:self.start + self.HEADER_SIZE]
+            pdu = self.view[self.start + self.HEADER_SIZE:frame_end]
+            self.start = frame_end
+            yield header, pdu
@@ -1,29 +1,105 @@
+import asyncio
 import socket
 import time
 import random
 from typing import Callable
 from modbushandler import modbusdecoder
 import threading
+import queue
 from typing import Dict
-from logger import Logger
+from logger import Logger, Lazy
 from time import sleep
 from modbushandler.util import stringify_bytes
+from modbushandler.modbusframer import ModbusTcpFramer
 from metecmodel import StatisticsCollector
+from modbushandler.asyncprotocols import ModbusTcpProtocol, ModbusUdpProtocol
+from modbushandler.timerwheel import TimerWheel
+
+
+class _DelayedSender:
+
+    """
+        Sends the delayed responses of one TCP connection from a thread of its own, started with the first of them.
+        Timer wheel callbacks only queue the responses, so a client that stops reading blocks this thread
+        and not the wheel shared by every port.
+    """
+    def __init__(self, receiver: 'ModbusReceiver', connection, send_lock):
+        self.receiver = receiver
+        self.connection = connection
+        self.send_lock = send_lock
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+
+    # Called on the timer wheel thread, never blocks
+    def send(self, responses) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self.queue.put(responses)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            responses = self.queue.get()
+            if responses is None:
+                return
+            try:
+                self.receiver._send_tcp(self.connection, self.send_lock, responses)
+            except OSError as e:
+                self.receiver.logger.debug('MB:{} Dropping delayed response, connection is gone {}',
+                                           self.receiver.port, e)
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    '''
+        Drops the responses still waiting for their delay, a send blocked on the connection fails
+    '''
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            if self.thread is not None:
+                self.queue.put(None)
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
 
 
 class ModbusReceiver:
 
-    def __init__(self, port, localhost=True, device_function_codes=None, socket_type=socket.SOCK_STREAM, failures={}):
+    def __init__(self, port, localhost=True, device_function_codes=None, socket_type=socket.SOCK_STREAM, failures={},
+                 max_connections=5, idle_timeout=None, timer_wheel: TimerWheel = None):
         self.port = port
         self.localhost = localhost
         self.stop = threading.Event()
         self.done = threading.Event()
+        # Set once the server is bound, port is then the bound port (port 0 binds to any free port)
+        self.started = threading.Event()
+        # Why the async server could not be started, done is set instead of started
+        self.error = None
         self.device_function_codes = device_function_codes
         self.logger = Logger('ServerLogger-{}'.format(port), '../logger/logs/server_log.txt', prefix='Server {}'.format(port))
-        self._current_connection = None
         self.socket_type = socket_type
         self.failures = failures
         self.lock = threading.RLock()
+        self._loop = None
+        self._async_server = None
+        # Open client connections, TCP clients are served concurrently up to max_connections
+        # and are dropped after idle_timeout seconds without a request (None waits forever)
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._connections = set()
+        # Delayed responses of the blocking servers are sent from the timer wheel, the receiver keeps reading
+        self.timer_wheel = timer_wheel
 
     '''
         Dispatches packet data for decoding based on it's function code.
@@ -50,164 +126,253 @@ class ModbusReceiver:
         function = switch.get(function_code, modbusdecoder.invalid_function_code)
         return function(packet_data)
 
+    def _get_host(self):
+        return 'localhost' if self.localhost else socket.gethostname()
+
+    '''
+        Decodes a single request (MBAP header + PDU) and passes it to the request handler.
+        Returns a tuple of (is_error, response) where error responses are built by the decoder and should
+        be sent back right away, while valid responses are still subject to the simulated failures.
+    '''
+    def process_request(self, header_data, data, request_handler: Callable) -> (bool, bytes):
+        header = modbusdecoder.dissect_header(header_data)
+        is_error, dissection = self._dissect_packet(data)
+        if is_error:
+            self.logger.debug('MB:{} Header appears like: {}', self.port, header)
+            self.logger.debug('MB:{} Request: {}{}', self.port, Lazy(stringify_bytes, header_data),
+                              Lazy(stringify_bytes, data))
+            self.logger.debug('MB:{} An error was found in the modbus request {}', self.port,
+                              Lazy(stringify_bytes, dissection))
+            return is_error, dissection
+        dissection['type'] = 'request'
+        header['function_code'] = data[0]
+        response = request_handler({
+            'header': header,
+            'body': dissection
+        })
+        self.logger.debug('MB:{} Header: {} Body:{}', self.port, header, dissection)
+        self.logger.debug('MB:{} Request: {}{}', self.port, Lazy(stringify_bytes, header_data),
+                          Lazy(stringify_bytes, data))
+        self.logger.debug('MB:{} Responding: {}', self.port, Lazy(stringify_bytes, response))
+        return is_error, response
+
+    '''
+        Counts a response once it has been sent, response_start is when its request came in.
+        Responses are counted under function_code, the one of the request they answer (errors included).
+    '''
+    def record_response(self, response_start, is_error=False, function_code=None):
+        response_stop = time.time()
+        if is_error:
+            StatisticsCollector.increment_error_packets_sent()
+        StatisticsCollector.increment_responses_sent()
+        StatisticsCollector.increment_avg_response(response_stop - response_start, self.port, function_code)
+
     def _start_server_tcp(self, request_handler: Callable) -> None:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            if self.localhost:
-                s.bind(('localhost', self.port))
-            else:
-                s.bind((socket.gethostname(), self.port))
-            s.listen(5)
-            self.logger.info('Server started {}:{}'.format(socket.gethostname(), self.port))
+            s.bind((self._get_host(), self.port))
+            s.listen(max(5, self.max_connections))
+            self.port = s.getsockname()[1]
+            self.started.set()
+            self.logger.info('Server started {}:{}', socket.gethostname(), self.port)
             while not self.stop.is_set():
                 if self.failures.get('disconnected', False):
                     sleep(1)
                     continue
-                self._current_connection, address = s.accept()
-                self.logger.info('New connection accepted {}'.format(self._current_connection.getpeername()))
-                with self._current_connection:
-                    while not self.stop.is_set():
-                        try:
-                            buffer = self._current_connection.recv(7)
-                            if buffer == b'' or len(buffer) <= 0:
-                                self.logger.debug('Initial read was empty, peer connection was likely closed')
-                                break
-                            header = buffer
-                            self.logger.debug('MB:{} Header DATA like: {}'.format(self.port, header))
-                            # Modbus length is in bytes 4 & 5 of the header according to spec (pg 25)
-                            # https://www.prosoft-technology.com/kb/assets/intro_modbustcp.pdf
-                            header = modbusdecoder.dissect_header(header)
-                            length = header['length']
-                            if length == 0:
-                                self.logger.debug('A length 0 header was read, closing connection')
-                                break
-                            data = self._current_connection.recv(length-1)
-                            StatisticsCollector.increment_packets_received()
-                            response_start = time.time()
-                            is_error, dissection = self._dissect_packet(data)
-                            if is_error:
-                                self.logger.debug('MB:{} Header appears like: {}'.format(self.port, header))
-                                self.logger.debug(
-                                    'MB:{} Request: {}'.format(self.port, stringify_bytes(buffer + data)))
-                                self.logger.debug(
-                                    'MB:{} An error was found in the modbus request {}'.format(self.port, stringify_bytes(dissection)))
-                                self._current_connection.sendall(dissection)
-                                response_stop = time.time()
-                                StatisticsCollector.increment_error_packets_sent()
-                                StatisticsCollector.increment_responses_sent()
-                                StatisticsCollector.increment_avg_response(response_stop - response_start)
-                                continue
-                            else:
-                                dissection['type'] = 'request'
-                                header['function_code'] = data[0]
-                                response = request_handler({
-                                    'header': header,
-                                    'body': dissection
-                                })
-                                self.logger.debug(
-                                    'MB:{} Header: {} Body:{}'.format(self.port, header, dissection))
-                                self.logger.debug(
-                                    'MB:{} Request: {}'.format(self.port, stringify_bytes(buffer + data)))
-                                self.logger.debug('MB:{} Responding: {}'.format(self.port, stringify_bytes(response)))
-                                # add failures to the receiver
-                                if not self.simulate_failures():
-                                    continue
-                                self._current_connection.sendall(response)
-                                response_stop = time.time()
-                                StatisticsCollector.increment_responses_sent()
-                                StatisticsCollector.increment_avg_response(response_stop - response_start)
-                        except IOError as e:
-                            self.logger.warning('An IO error occurred when reading the socket {}'.format(e))
-                            self.logger.debug('Closing connection')
-                            self._current_connection.close()
-                            StatisticsCollector.increment_socket_errors()
-                            break
+                connection, address = s.accept()
+                if self.stop.is_set() or not self.register_connection(connection):
+                    connection.close()
+                    continue
+                self.logger.info('New connection accepted {}', address)
+                connection.settimeout(self.idle_timeout)
+                threading.Thread(target=self._serve_tcp_connection, args=(connection, request_handler),
+                                 daemon=True).start()
             self.done.set()
 
+    def _get_timer_wheel(self) -> TimerWheel:
+        if self.timer_wheel is None:
+            self.timer_wheel = TimerWheel.default()
+        return self.timer_wheel
+
+    '''
+        Sends responses, (response, response_start, is_error, function_code) tuples, in a single sendall. Delayed responses
+        are sent by the _DelayedSender of the connection, the send lock keeps them from interleaving with the
+        connection thread.
+    '''
+    def _send_tcp(self, connection, send_lock, responses) -> None:
+        with send_lock:
+            connection.sendall(b''.join(response for response, _, _, _ in responses))
+        for _, response_start, is_error, function_code in responses:
+            self.record_response(response_start, is_error, function_code)
+
+    '''
+        Reads requests from a single client until it disconnects, goes idle for longer than idle_timeout
+        or the server is stopped. Every accepted connection is served on its own thread.
+        Reads are buffered by a ModbusTcpFramer, all requests that arrived together are answered back to back
+        and their responses go out in a single sendall. Responses delayed by a simulated failure are handed
+        to a _DelayedSender by the timer wheel once their delay is up, in the meantime later requests are read
+        and answered.
+    '''
+    def _serve_tcp_connection(self, connection, request_handler: Callable) -> None:
+        framer = ModbusTcpFramer()
+        send_lock = threading.Lock()
+        delayed_sender = _DelayedSender(self, connection, send_lock)
+        try:
+            # the sender is closed first, while the connection can still be shut down
+            with connection, delayed_sender:
+                while not self.stop.is_set():
+                    try:
+                        if framer.recv_from(connection) == 0:
+                            self.logger.debug('Initial read was empty, peer connection was likely closed')
+                            break
+                        keep_open, results = self.process_frames(framer, request_handler)
+                        # add failures to the receiver
+                        responses = self.apply_failures(results, self._get_timer_wheel().schedule,
+                                                        delayed_sender.send)
+                        if responses:
+                            self._send_tcp(connection, send_lock, responses)
+                        if not keep_open:
+                            break
+                    except socket.timeout:
+                        self.logger.info('MB:{} Connection idle for {}s, closing it', self.port, self.idle_timeout)
+                        break
+                    except IOError as e:
+                        if self.stop.is_set():
+                            break
+                        self.logger.warning('An IO error occurred when reading the socket {}', e)
+                        self.logger.debug('Closing connection')
+                        StatisticsCollector.increment_socket_errors()
+                        break
+        finally:
+            self.unregister_connection(connection)
+
+    '''
+        Handles every complete request buffered in the framer.
+        Returns (keep_open, results) where results holds a (response, response_start, is_error, function_code)
+        tuple for each request, in request order. Simulated failures are left to the caller.
+    '''
+    def process_frames(self, framer: ModbusTcpFramer, request_handler: Callable):
+        results = []
+        try:
+            for header_data, data in framer.frames():
+                self.logger.debug('MB:{} Header DATA like: {}', self.port, Lazy(stringify_bytes, header_data))
+                # Modbus length is in bytes 4 & 5 of the header according to spec (pg 25)
+                # https://www.prosoft-technology.com/kb/assets/intro_modbustcp.pdf
+                if len(data) == 0:
+                    self.logger.debug('A length 0 header was read, closing connection')
+                    return False, results
+                StatisticsCollector.increment_packets_received()
+                response_start = time.time()
+                is_error, response = self.process_request(header_data, data, request_handler)
+                results.append((response, response_start, is_error, data[0]))
+        except ValueError as e:
+            self.logger.warning('MB:{} {}, closing connection', self.port, e)
+            return False, results
+        return True, results
+
     def _start_server_udp(self, request_handler: Callable) -> None:
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            if self.localhost:
-                s.bind(('localhost', self.port))
-                self.logger.info('Starting UDP server at localhost:{}'.format(self.port))
-            else:
-                s.bind((socket.gethostname(), self.port))
-                self.logger.debug('Starting UDP server at {}:{}'.format(socket.gethostname(), self.port))
+            s.bind((self._get_host(), self.port))
+            self.port = s.getsockname()[1]
+            self.started.set()
+            self.logger.info('Starting UDP server at {}:{}', self._get_host(), self.port)
             while not self.stop.is_set():
                 try:
                     if self.failures.get('disconnected', False):
                         sleep(1)
                         continue
                     buffer, address = s.recvfrom(256)
-                    self.logger.debug('Message received from: {}'.format(address))
-                    StatisticsCollector.increment_packets_received()
-                    response_start = time.time()
-                    if buffer == b'' or len(buffer) <= 0:
-                        self.logger.debug('Initial read was empty, peer connection was likely closed')
+                    self.logger.debug('Message received from: {}', address)
+                    result = self.process_datagram(buffer, request_handler)
+                    if result is None:
                         continue
-                    header = buffer[:7]
-                    header = modbusdecoder.dissect_header(header)
-                    length = header['length']
-                    if length == 0:
-                        self.logger.debug('Length 0 message received')
-                        continue
-                    data = buffer[7: 7 + length - 1]
-                    is_error, dissection = self._dissect_packet(data)
-                    if is_error:
-                        self.logger.debug('An error was found in the modbus request {}'.format(dissection))
-                        self.logger.debug('Header appears like: {}'.format(header))
-                        self.logger.debug('Buffer: {}'.format(stringify_bytes(buffer)))
-                        s.sendto(dissection, address)
-                        response_stop = time.time()
-                        StatisticsCollector.increment_avg_response(response_stop - response_start)
-                        StatisticsCollector.increment_error_packets_sent()
-                        StatisticsCollector.increment_responses_sent()
-                        continue
-                    else:
-                        dissection['type'] = 'request'
-                        header['function_code'] = data[0]
-                        response = request_handler({
-                            'header': header,
-                            'body': dissection
-                        })
-                        # add failures to the receiver
-                        if not self.simulate_failures():
+                    (response_start, is_error, function_code), response = result
+                    if not is_error:
+                        should_respond, delay = self.get_failure_action()
+                        if not should_respond:
                             continue
-                        s.sendto(response, address)
-                        response_stop = time.time()
-                        StatisticsCollector.increment_avg_response(response_stop - response_start)
-                        StatisticsCollector.increment_responses_sent()
-                        self.logger.debug('MB:{} Request: {}'.format(self.port, stringify_bytes(buffer[:7+length])))
-                        self.logger.debug('MB:{} Header: {} Body:{}'.format(self.port, header, dissection))
-                        self.logger.debug('MB:{} Responding: {}'.format(self.port, stringify_bytes(response)))
+                        if delay:
+                            self._get_timer_wheel().schedule(delay, self._send_udp_delayed, s, response, address,
+                                                             response_start, function_code)
+                            continue
+                    s.sendto(response, address)
+                    self.record_response(response_start, is_error, function_code)
                 except IOError as e:
-                    self.logger.warning('An IO error occurred with the socket {}'.format(e))
+                    self.logger.warning('An IO error occurred with the socket {}', e)
                     StatisticsCollector.increment_socket_errors()
                     continue
         self.done.set()
 
-    # Return False to not respond
-    def simulate_failures(self):
+    def _send_udp_delayed(self, s, response, address, response_start, function_code) -> None:
+        try:
+            s.sendto(response, address)
+            self.record_response(response_start, function_code=function_code)
+        except OSError as e:
+            self.logger.debug('MB:{} Dropping delayed response, socket is closed {}', self.port, e)
+
+    '''
+        Handles a single UDP datagram. Returns None if nothing should be sent back, otherwise
+        ((response_start, is_error, function_code), response) so the caller can record the response once it has been sent.
+        Simulated failures are left to the caller, see get_failure_action.
+    '''
+    def process_datagram(self, buffer, request_handler: Callable):
+        StatisticsCollector.increment_packets_received()
+        response_start = time.time()
+        if buffer == b'' or len(buffer) <= 0:
+            self.logger.debug('Initial read was empty, peer connection was likely closed')
+            return None
+        buffer = memoryview(buffer)
+        length = modbusdecoder.dissect_header(buffer[:7])['length']
+        if length == 0:
+            self.logger.debug('Length 0 message received')
+            return None
+        is_error, response = self.process_request(buffer[:7], buffer[7: 7 + length - 1], request_handler)
+        return (response_start, is_error, buffer[7]), response
+
+    '''
+        Decides how the simulated failures apply to the next response.
+        Returns a tuple of (should_respond, delay_in_seconds).
+    '''
+    def get_failure_action(self) -> (bool, float):
         with self.lock:
             if self.failures.get('stop-responding', False):
-                self.logger.info('MB:{} Simulating no-response'.format(self.port))
-                return False
+                self.logger.info('MB:{} Simulating no-response', self.port)
+                return False, 0
             elif self.failures.get('flake-response'):
                 val = random.choice([1, 2, 3])
                 if val == 1:
                     upper_bound = self.failures['flake-response']
                     sleep_time = random.randint(0, upper_bound) * 0.01
-                    self.logger.info('MB:{} Simulating flake-response "delayed" {}ms'.format(self.port, sleep_time))
-                    time.sleep(sleep_time)
+                    self.logger.info('MB:{} Simulating flake-response "delayed" {}ms', self.port, sleep_time)
+                    return True, sleep_time
                 elif val == 2:
-                    self.logger.info('MB:{} Simulating flake-response "no-response"'.format(self.port))
-                    return False
+                    self.logger.info('MB:{} Simulating flake-response "no-response"', self.port)
+                    return False, 0
             elif self.failures.get('delay-response', False):
                 upper_bound = self.failures['delay-response']
                 sleep_time = random.randint(0, upper_bound) * 0.01
-                self.logger.info('MB:{} Simulating delay-response {}ms'.format(self.port, sleep_time))
-                time.sleep(sleep_time)
-            return True
+                self.logger.info('MB:{} Simulating delay-response {}ms', self.port, sleep_time)
+                return True, sleep_time
+            return True, 0
+
+    '''
+        Applies the simulated failures to the results of process_frames. Returns the responses to send right
+        away, delayed responses are passed to schedule(delay, send, [result]) (a timer wheel or the event loop)
+        and dropped responses are left out. Error responses are never subject to failures.
+    '''
+    def apply_failures(self, results, schedule: Callable, send: Callable) -> list:
+        responses = []
+        for result in results:
+            if not result[2]:
+                should_respond, delay = self.get_failure_action()
+                if not should_respond:
+                    continue
+                if delay:
+                    schedule(delay, send, [result])
+                    continue
+            responses.append(result)
+        return responses
 
     def set_failures(self, failures):
         with self.lock:
@@ -225,6 +390,63 @@ class ModbusReceiver:
         else:
             self._start_server_udp(request_handler)
 
+    '''
+        Same as start_server, but opens the TCP or UDP endpoint on the currently running asyncio event loop
+        instead of blocking the calling thread. Any number of receivers can share one loop, see
+        modbushandler.AsyncModbusServer. Like start_server it only listens on IPv4.
+    '''
+    async def start_server_async(self, request_handler: Callable) -> None:
+        self._loop = asyncio.get_event_loop()
+        if self.socket_type == socket.SOCK_STREAM:
+            self._async_server = await self._loop.create_server(
+                lambda: ModbusTcpProtocol(self, request_handler), self._get_host(), self.port,
+                family=socket.AF_INET, reuse_address=True)
+            self.port = self._async_server.sockets[0].getsockname()[1]
+            self.logger.info('Async server started {}:{}', self._get_host(), self.port)
+        else:
+            self._async_server, _ = await self._loop.create_datagram_endpoint(
+                lambda: ModbusUdpProtocol(self, request_handler), local_addr=(self._get_host(), self.port),
+                family=socket.AF_INET)
+            self.port = self._async_server.get_extra_info('sockname')[1]
+            self.logger.info('Starting async UDP server at {}:{}', self._get_host(), self.port)
+        self.started.set()
+
+    '''
+        Tracks a newly accepted connection (a socket or an asyncio transport).
+        Returns False if the port already serves max_connections clients, the caller should drop the connection.
+    '''
+    def register_connection(self, connection) -> bool:
+        with self.lock:
+            if self.max_connections and len(self._connections) >= self.max_connections:
+                self.logger.warning('MB:{} Connection limit of {} reached, refusing connection', self.port,
+                                    self.max_connections)
+                return False
+            self._connections.add(connection)
+            return True
+
+    def unregister_connection(self, connection) -> None:
+        with self.lock:
+            self._connections.discard(connection)
+
+    def _close_connections(self) -> None:
+        with self.lock:
+            connections = list(self._connections)
+        for connection in connections:
+            if isinstance(connection, socket.socket):
+                # wakes up the thread blocked in recv on this connection
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            connection.close()
+
+    def stop_server_async(self) -> None:
+        if self._async_server:
+            self._async_server.close()
+            self._async_server = None
+        self._close_connections()
+        self.done.set()
+
     '''
         Breaks the server out of it's blocking accept or recv calls and sets the stop flag.
         In order to do this the method uses a 'dummy' connection to break the blocking call.
@@ -234,8 +456,10 @@ class ModbusReceiver:
     def stop_server(self) -> None:
         self.logger.info('Stopping server now')
         self.stop.set()
-        if self._current_connection:
-            self._current_connection.close()
+        if self._loop:
+            self._loop.call_soon_threadsafe(self.stop_server_async)
+            return
+        self._close_connections()
         sleep(.5)
         # In order to stop the server we have to interrupt
         # The blocking socket.accept()
@@ -243,10 +467,7 @@ class ModbusReceiver:
         # Packet
         if not self.done.is_set() and self.socket_type == socket.SOCK_STREAM:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                if self.localhost:
-                    s.connect(('localhost', self.port))
-                else:
-                    s.connect((socket.gethostname(), self.port))
+                s.connect((self._get_host(), self.port))
                 s.sendall(b'\x00\x01\x00\x00\x00\x00\x00')
                 s.close()
 
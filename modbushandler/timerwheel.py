@@ -0,0 +1,132 @@
+import math
+import threading
+import time
+from typing import Callable
+from logger import Logger
+
+"""
+    Hashed timer wheel for the delayed responses of the simulated failures. Timers are put in the slot of the tick
+    they are due on and a single thread walks the slots as ticks go by, so scheduling and cancelling are O(1) and
+    any number of delayed responses costs one thread instead of a sleeping receiver thread each.
+"""
+
+
+class Timer:
+
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback: Callable, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    '''
+        tick is the resolution in seconds, timers due more than slots ticks ahead go around the wheel
+        until their tick comes up.
+    '''
+    def __init__(self, tick=0.01, slots=512):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self._condition = threading.Condition(threading.Lock())
+        self._start = time.monotonic()
+        # Last tick whose slot was handled, and the number of timers in the slots
+        self._current_tick = 0
+        self._pending = 0
+        self._stopped = False
+        self._thread = None
+        self.logger = Logger('TimerWheelLogger', '../logger/logs/server_log.txt')
+
+    '''
+        Wheel shared by every receiver of the process, its thread is started with the first timer
+    '''
+    @staticmethod
+    def default() -> 'TimerWheel':
+        with TimerWheel._default_lock:
+            if TimerWheel._default is None:
+                TimerWheel._default = TimerWheel()
+            return TimerWheel._default
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._start) / self.tick)
+
+    '''
+        Calls callback(*args) on the wheel thread after delay seconds, rounded up to the next tick.
+        Callbacks must not block, every timer due on a tick waits for the ones before it.
+    '''
+    def schedule(self, delay, callback: Callable, *args) -> Timer:
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError('Timer wheel is stopped')
+            if self._pending == 0:
+                self._current_tick = self._now_tick()
+            deadline = max(self._now_tick() + math.ceil(delay / self.tick), self._current_tick + 1)
+            timer = Timer(deadline, callback, args)
+            self.slots[deadline % len(self.slots)].append(timer)
+            self._pending = self._pending + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='TimerWheel', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return timer
+
+    def pending(self) -> int:
+        with self._condition:
+            return self._pending
+
+    '''
+        Takes the timers due up to now out of their slots. A slot is only visited once per turn of the wheel,
+        so after a stall longer than a turn every slot is checked once.
+    '''
+    def _advance(self):
+        now = self._now_tick()
+        if now - self._current_tick >= len(self.slots):
+            indexes = range(len(self.slots))
+        else:
+            indexes = [t % len(self.slots) for t in range(self._current_tick + 1, now + 1)]
+        due = []
+        for index in indexes:
+            slot = self.slots[index]
+            if slot:
+                due.extend(timer for timer in slot if timer.deadline <= now)
+                slot[:] = [timer for timer in slot if timer.deadline > now]
+        self._current_tick = now
+        self._pending = self._pending - len(due)
+        due.sort(key=lambda timer: timer.deadline)
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending == 0 and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                next_tick = self._start + (self._current_tick + 1) * self.tick
+                wait = next_tick - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                due = self._advance()
+            for timer in due:
+                if timer.cancelled:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    self.logger.warning('Timer callback {} failed {}', timer.callback, e)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
@@ -0,0 +1,152 @@
+import socket
+import struct
+import time
+import unittest
+from modbushandler import ModbusReceiver, AsyncModbusServer
+import modbushandler.modbusencoder as encoder
+from main_program import ServerLoopThread
+from metecmodel import Model
+from labjackemulator import LabJack
+
+
+class TestAsyncModbusServer(unittest.TestCase):
+
+    gashouse_boxes = {'GSH-1': ['CB-1W', 'CB-1S', 'CB-1T', 'CB-2W', 'CB-2S', 'CB-2T'],
+                      'GSH-1_FM': ['FM-1', 'FM-2', 'FM-3', 'FM-4']}
+    model = Model('../Resources/sensor_properties.csv', ['../Resources/GSH-1-volumes.json'], gashouse_boxes,
+                  initial_pressure={'GSH-1': 50})
+
+    def setUp(self):
+        self.server = AsyncModbusServer()
+        self.tcp = ModbusReceiver(0, idle_timeout=0.3)
+        self.udp = ModbusReceiver(0, socket_type=socket.SOCK_DGRAM)
+        self.server.add_receiver(self.tcp, self.handler)
+        self.server.add_receiver(self.udp, self.handler)
+        self.labjack = LabJack('CB-1W.LJ-1', '../Resources/pins_to_registers.csv',
+                               '../Resources/sensor_properties.csv', self.model, 0)
+        self.labjack.start_server_async(self.server)
+        self.thread = ServerLoopThread(self.server)
+        self.thread.start()
+        self.assertTrue(self.server.started.wait(5))
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.thread.stop()
+        self.thread.join(5)
+
+    '''
+        Answers read requests with the requested address
+    '''
+    @staticmethod
+    def handler(request):
+        return encoder.respond_read_registers(request['header'], [(request['body']['address'], 'UINT16')])
+
+    def connect(self, receiver) -> socket.socket:
+        client = socket.create_connection(('localhost', receiver.port), timeout=5)
+        self.clients.append(client)
+        return client
+
+    @staticmethod
+    def request(transaction_id, address, count=1) -> bytes:
+        return struct.pack('>HHHBBHH', transaction_id, 0, 6, 1, 3, address, count)
+
+    @staticmethod
+    def receive(client, size) -> bytes:
+        response = b''
+        while len(response) < size:
+            data = client.recv(size - len(response))
+            if not data:
+                raise ConnectionError('connection closed')
+            response = response + data
+        return response
+
+    def read_response(self, client) -> (int, int):
+        response = self.receive(client, 11)
+        return struct.unpack('>H', response[:2])[0], struct.unpack('>H', response[9:])[0]
+
+    def test_tcp_round_trip(self):
+        client = self.connect(self.tcp)
+        client.sendall(self.request(1, 100))
+        self.assertEqual((1, 100), self.read_response(client))
+
+    def test_split_request(self):
+        client = self.connect(self.tcp)
+        request = self.request(2, 200)
+        client.sendall(request[:5])
+        time.sleep(0.05)
+        client.sendall(request[5:])
+        self.assertEqual((2, 200), self.read_response(client))
+
+    def test_pipelined_requests(self):
+        client = self.connect(self.tcp)
+        client.sendall(b''.join(self.request(i, i * 10) for i in range(3)))
+        for i in range(3):
+            self.assertEqual((i, i * 10), self.read_response(client))
+
+    def test_udp(self):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.clients.append(client)
+        client.settimeout(5)
+        client.sendto(self.request(4, 400), ('localhost', self.udp.port))
+        response, _ = client.recvfrom(256)
+        self.assertEqual(11, len(response))
+        self.assertEqual((4, 400), (struct.unpack('>H', response[:2])[0], struct.unpack('>H', response[9:])[0]))
+
+    def test_idle_timeout(self):
+        client = self.connect(self.tcp)
+        client.sendall(self.request(5, 500))
+        self.assertEqual((5, 500), self.read_response(client))
+        start = time.monotonic()
+        self.assertEqual(b'', client.recv(11))
+        self.assertLess(time.monotonic() - start, 2)
+
+    '''
+        AIN2 (registers 4 and 5) is CB-1W.TC-1
+    '''
+    def test_labjack(self):
+        client = self.connect(self.labjack.receiver)
+        client.sendall(self.request(6, 4, 2))
+        response = self.receive(client, 13)
+        self.assertEqual((6, 3, 4), struct.unpack('>HxxxxxBB', response[:9]))
+        self.assertEqual(self.model.get_component('CB-1W.TC-1').get_reading_voltage(),
+                         struct.unpack('>f', response[9:])[0])
+
+    '''
+        A receiver on a port that is already taken keeps the error, the server reports it in get_failed
+    '''
+    def test_port_in_use(self):
+        taken = socket.create_server(('localhost', 0))
+        self.addCleanup(taken.close)
+        receiver = ModbusReceiver(taken.getsockname()[1])
+        server = AsyncModbusServer()
+        server.add_receiver(receiver, self.handler)
+        thread = ServerLoopThread(server)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(thread.stop)
+        self.assertTrue(server.started.wait(5))
+        self.assertIsInstance(receiver.error, OSError)
+        self.assertTrue(receiver.done.is_set())
+        self.assertFalse(receiver.started.is_set())
+        self.assertEqual([(receiver, receiver.error)], server.get_failed())
+
+    def test_stop(self):
+        client = self.connect(self.tcp)
+        client.sendall(self.request(7, 700))
+        self.assertEqual((7, 700), self.read_response(client))
+        self.thread.stop()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertTrue(self.server.loop.is_closed())
+        # open connections are closed and the ports no longer accept any
+        self.assertEqual(b'', client.recv(11))
+        with self.assertRaises(ConnectionRefusedError):
+            socket.create_connection(('localhost', self.tcp.port), timeout=5)
+        for receiver in [self.tcp, self.udp, self.labjack.receiver]:
+            self.assertTrue(receiver.done.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from metecmodel import Model
+from metecmodel.components import ElectricValve, PressureTransducer
+
+
+class TestComponents(unittest.TestCase):
+
+    gashouse_boxes = {'GSH-1': ['CB-1W', 'CB-1S', 'CB-1T', 'CB-2W', 'CB-2S', 'CB-2T'],
+                      'GSH-1_FM': ['FM-1', 'FM-2', 'FM-3', 'FM-4']}
+    model = Model('../Resources/sensor_properties.csv', ['../Resources/GSH-1-volumes.json'], gashouse_boxes)
+
+    def test_parsed_fields(self):
+        row = {'name': 'CB-1W.PT-1', 'reader': 'CB-1W.LJ-1', 'item_type': 'Pressure Transducer', 'pin': 'AIN0',
+               'raw_units': 'V', 'slope': '2', 'offset': '0.5', 'output_units': 'PSIA', 'min': '', 'max': '100'}
+        pt = PressureTransducer('CB-1W.PT-1', ['VOL-1'], row)
+        self.assertEqual('AIN0', pt.pin)
+        self.assertEqual('PSIA', pt.output_units)
+        self.assertEqual(0.0, pt.min)
+        self.assertEqual(100.0, pt.max)
+        self.assertEqual(2.0, pt.store.slope[pt.sid])
+        self.assertFalse(hasattr(pt, '__dict__'))
+        valve = ElectricValve('CB-1W.EV-11', {'open': [], 'closed': []})
+        self.assertFalse(hasattr(valve, '__dict__'))
+        self.assertEqual('IN-DIA', valve.output_units)
+
+    '''
+        Components are registered by name and id when the model is built
+    '''
+    def test_registry(self):
+        component = self.model.get_component('CB-1W.PT-1')
+        self.assertEqual('CB-1W.PT-1', component.get_full_name())
+        self.assertIs(component, self.model.get_component_by_id(component.component_id))
+        self.assertIs(component, self.model.controller_boxes['CB-1W'].get_component('CB-1W.PT-1'))
+        self.assertEqual(len(self.model.components), len(self.model.component_list))
+        with self.assertRaises(KeyError):
+            self.model.get_component('CB-1W.PT-99')
+        with self.assertRaises(KeyError):
+            self.model.get_component_by_id(len(self.model.component_list))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from metecmodel import EmissionsTable, EmissionsBatch
+
+
+class TestEmissionsTable(unittest.TestCase):
+
+    path = '../Resources/Emissions/emissions_2_5_row1.csv'
+
+    def test_loaded_once(self):
+        self.assertIs(EmissionsTable.load(self.path), EmissionsTable.load(self.path))
+
+    def test_valve_state_code(self):
+        self.assertEqual(0, EmissionsTable.valve_state_code('0000'))
+        self.assertEqual(1, EmissionsTable.valve_state_code('1000'))
+        self.assertEqual(6, EmissionsTable.valve_state_code('0110'))
+        self.assertEqual(6, EmissionsTable.valve_state_code(6))
+
+    def test_exact(self):
+        table = EmissionsTable.load(self.path)
+        self.assertEqual(1.4, table.get_emissions(5, '1000'))
+        self.assertEqual(2.0, table.get_emissions(10, 1))
+
+    def test_interpolate(self):
+        table = EmissionsTable.load(self.path)
+        self.assertAlmostEqual(1.7, table.get_emissions(7.5, '1000'))
+
+    '''
+        The batch gives the same emissions as the tables one row at a time, tables of different sizes included
+    '''
+    def test_batch(self):
+        tables = [EmissionsTable.load('../Resources/Emissions/emissions_{}.csv'.format(name))
+                  for name in ['2_5_row1', '3_4_row1', '3_4_row3', '2_5_row2']]
+        batch = EmissionsBatch(tables)
+        for pressures, codes in [([5, 10, 120, 100], [1, 7, 3, 15]), ([2.5, 15, 33.3, 99.9], [15, 0, 5, 9])]:
+            expected = [table.get_emissions(p, c) for table, p, c in zip(tables, pressures, codes)]
+            self.assertEqual(expected, batch.get_emissions(pressures, codes).tolist())
+        with self.assertRaises(IndexError):
+            batch.get_emissions([5, 5, 5, 101], [0, 0, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from metecmodel import Model
+
+
+class TestFlowCache(unittest.TestCase):
+
+    gashouse_boxes = {'GSH-1': ['CB-1W', 'CB-1S', 'CB-1T', 'CB-2W', 'CB-2S', 'CB-2T'],
+                      'GSH-1_FM': ['FM-1', 'FM-2', 'FM-3', 'FM-4']}
+    model = Model('../Resources/sensor_properties.csv', ['../Resources/GSH-1-volumes.json'], gashouse_boxes,
+                  initial_pressure={'GSH-1': 50})
+    model.set_valve('GSH-1.EV-1', 'open')
+
+    def test_cached_until_state_changes(self):
+        flows = self.model.calculate_flows('GSH-1')
+        version = self.model.get_state_version('GSH-1')
+        self.assertEqual(flows, self.model.calculate_flows('GSH-1'))
+        # setting a valve to the state it is already in changes nothing
+        state = self.model.get_component('CB-1W.EV-12').get_reading()
+        self.model.set_valve('CB-1W.EV-12', state)
+        self.assertEqual(version, self.model.get_state_version('GSH-1'))
+        self.model.set_valve('CB-1W.EV-12', 'open' if state == 'closed' else 'closed')
+        self.assertEqual(version + 1, self.model.get_state_version('GSH-1'))
+        self.assertNotEqual(flows, self.model.calculate_flows('GSH-1'))
+        self.model.set_valve('CB-1W.EV-12', state)
+        self.assertEqual(flows, self.model.calculate_flows('GSH-1'))
+
+    def test_pressure_change(self):
+        self.model.set_valve('CB-1W.EV-12', 'open')
+        flows = self.model.calculate_flows('GSH-1')
+        version = self.model.get_state_version('GSH-1')
+        self.model.change_model_pressure(20, 'GSH-1')
+        self.assertEqual(version + 1, self.model.get_state_version('GSH-1'))
+        self.assertNotEqual(flows, self.model.calculate_flows('GSH-1'))
+        self.model.change_model_pressure(50, 'GSH-1')
+        self.assertEqual(flows, self.model.calculate_flows('GSH-1'))
+        self.model.set_valve('CB-1W.EV-12', 'closed')
+
+    def test_topology_memoized(self):
+        self.model.set_valve('CB-1W.EV-12', 'open')
+        self.model.set_valve('CB-1W.EV-12', 'closed')
+        code = self.model.get_valve_state_code('GSH-1')
+        flows = self.model.calculate_flows('GSH-1')
+        self.model.set_valve('CB-1W.EV-12', 'open')
+        self.assertNotEqual(code, self.model.get_valve_state_code('GSH-1'))
+        self.model.calculate_flows('GSH-1')
+        topologies = len(self.model.partitions['GSH-1'].topologies)
+        self.model.set_valve('CB-1W.EV-12', 'closed')
+        self.assertEqual(code, self.model.get_valve_state_code('GSH-1'))
+        self.assertEqual(flows, self.model.calculate_flows('GSH-1'))
+        self.assertEqual(topologies, len(self.model.partitions['GSH-1'].topologies))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from metecmodel import Model
+from labjackemulator import LabJack
+
+
+class TestLabjackTables(unittest.TestCase):
+
+    gashouse_boxes = {'GSH-1': ['CB-1W', 'CB-1S', 'CB-1T', 'CB-2W', 'CB-2S', 'CB-2T'],
+                      'GSH-1_FM': ['FM-1', 'FM-2', 'FM-3', 'FM-4']}
+    model = Model('../Resources/sensor_properties.csv', ['../Resources/GSH-1-volumes.json'], gashouse_boxes,
+                  initial_pressure={'GSH-1': 50})
+
+    def setUp(self):
+        self.labjack = LabJack('CB-1W.LJ-1', '../Resources/pins_to_registers.csv',
+                               '../Resources/sensor_properties.csv', self.model, 0)
+
+    '''
+        Every pin of the reader is wired to its component in the model
+    '''
+    def test_pin_components(self):
+        pin_components = self.labjack._pin_components
+        self.assertEqual(14, len(pin_components))
+        self.assertIs(self.model.get_component('CB-1W.PT-1'), pin_components['AIN0'])
+        self.assertIs(self.model.get_component('CB-1W.TC-1'), pin_components['AIN2'])
+        self.assertIs(self.model.get_component('CB-1W.EV-14'), pin_components['CIO0'])
+        self.assertNotIn('AIN1', pin_components)
+
+    def test_pin_components_not_in_model(self):
+        self.labjack.sensors = (('CB-1W.PT-1', 'AIN0'), ('CB-1W.PT-9', 'AIN4'), ('CB-1W.TC-1', ''))
+        pin_components = self.labjack._build_pin_components()
+        self.assertEqual(['AIN0'], list(pin_components))
+
+    def test_dio_components(self):
+        self.assertEqual(23, len(self.labjack._dio_components))
+        # DIO16 is CIO0
+        self.assertIs(self.model.get_component('CB-1W.EV-14'), self.labjack._dio_components[16])
+        self.assertIsNone(self.labjack._dio_components[0])
+
+    '''
+        AIN0 and AIN1 are FLOAT32, two registers each
+    '''
+    def test_plan(self):
+        plan = self.labjack._get_plan(0, 4)
+        self.assertEqual([0, 2], [register for register, info in plan])
+        self.assertEqual(['AIN0', 'AIN1'], [info.pin for register, info in plan])
+        self.assertIs(plan, self.labjack._get_plan(0, 4))
+        self.assertIsNot(plan, self.labjack._get_plan(0, 2))
+        self.assertEqual(2, len(self.labjack._plans))
+
+    def test_plans_cleared_when_full(self):
+        self.labjack.MAX_PLANS = 3
+        plans = [self.labjack._get_plan(0, count) for count in (2, 4, 6)]
+        self.assertEqual(3, len(self.labjack._plans))
+        plan = self.labjack._get_plan(0, 8)
+        self.assertEqual(1, len(self.labjack._plans))
+        self.assertIs(plan, self.labjack._get_plan(0, 8))
+        # plans resolved again after the clear are equal to the old ones
+        self.assertIsNot(plans[0], self.labjack._get_plan(0, 2))
+        self.assertEqual(plans[0], self.labjack._get_plan(0, 2))
+        self.assertEqual(2, len(self.labjack._plans))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import logging
+import queue
+import unittest
+from unittest import mock
+from logger import Logger, Lazy
+
+
+class TestLogger(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.logger = Logger('TestLogger-1', '../logger/logs/test_log.txt')
+
+    def tearDown(self):
+        Logger.set_level(logging.INFO)
+        Logger.levels.clear()
+
+    def stringify(self, value):
+        self.calls.append(value)
+        return 'stringified {}'.format(value)
+
+    def read_log(self):
+        self.assertTrue(Logger.flush())
+        with open(self.logger.logger.handlers[0].target.path) as log_file:
+            return log_file.read()
+
+    '''
+        Arguments of disabled levels are never formatted
+    '''
+    def test_disabled_level_is_lazy(self):
+        self.logger.debug('not written {}', Lazy(self.stringify, 'debug'))
+        self.logger.info('written {} {}', 1, Lazy(self.stringify, bytearray(b'ab')))
+        self.assertNotIn('debug', self.calls)
+        log = self.read_log()
+        self.assertNotIn('not written', log)
+        self.assertIn("written 1 stringified b'ab'", log)
+
+    '''
+        Containers are logged as they were when the message was logged, not when it was written
+    '''
+    def test_arguments_at_call_time(self):
+        header = {'transaction_id': 1}
+        values = [1, 2]
+        self.logger.info('header {} values {}', header, values)
+        header['function_code'] = 3
+        values.append(3)
+        self.assertIn("header {'transaction_id': 1} values [1, 2]\n", self.read_log())
+
+    def test_subsystem_level(self):
+        other = Logger('OtherLogger-1', '../logger/logs/test_log.txt')
+        Logger.set_level(logging.DEBUG, 'TestLogger')
+        self.assertTrue(self.logger.is_enabled_for(logging.DEBUG))
+        self.assertFalse(other.is_enabled_for(logging.DEBUG))
+        self.logger.debug('debug of {}', 'TestLogger')
+        self.assertIn('debug of TestLogger', self.read_log())
+        Logger.set_level('WARNING')
+        self.assertFalse(other.is_enabled_for(logging.INFO))
+        self.assertTrue(self.logger.is_enabled_for(logging.DEBUG))
+
+    '''
+        Loggers writing to the same file share its handler, and so its open file
+    '''
+    def test_shared_file_handler(self):
+        other = Logger('OtherLogger-2', '../logger/logs/test_log.txt')
+        self.assertEqual(self.logger.logger.handlers, other.logger.handlers)
+        self.assertEqual(1, len(other.logger.handlers))
+        for i in range(1000):
+            other.info('line {}', i)
+        self.logger.info('last line')
+        log = self.read_log().splitlines()
+        self.assertIn('line 999', log[-2])
+        self.assertIn('last line', log[-1])
+
+    '''
+        Messages logged while the writer queue is full are dropped, counted and reported in the log
+    '''
+    def test_queue_overflow(self):
+        self.assertTrue(Logger.flush())
+        writer_queue = Logger.writer_queue
+        file_handler = self.logger.logger.handlers[0].target
+        dropped = Logger.dropped_messages
+        Logger.writer_queue = queue.Queue(maxsize=2)
+        try:
+            # the writer can take at most one message before it waits for the file handler
+            with file_handler.lock:
+                for i in range(10):
+                    self.logger.info('overflow {}', i)
+                self.assertIn(Logger.dropped_messages - dropped, [7, 8])
+                written = 10 - (Logger.dropped_messages - dropped)
+            log = self.read_log()
+        finally:
+            Logger.writer_queue = writer_queue
+        for i in range(written):
+            self.assertIn('overflow {}\n'.format(i), log)
+        self.assertNotIn('overflow {}\n'.format(written), log)
+        self.assertIn('{} log messages dropped'.format(10 - written), log)
+
+    '''
+        Loggers created in a later minute still write to the directory of the first logger
+    '''
+    def test_one_directory_per_process(self):
+        log_dir = Logger.get_dir()
+        with mock.patch('logger.logger.time.strftime', return_value='2000-01-01-00:00'):
+            other = Logger('OtherLogger-3', '../logger/logs/test_log.txt')
+        self.assertEqual(self.logger.logger.handlers, other.logger.handlers)
+        self.assertEqual(log_dir, Logger.get_dir())
+
+    def test_braces_without_args(self):
+        self.logger.info('Returning flows {}'.format({'GSH-1.FM-1': 1.0}))
+        self.assertIn("Returning flows {'GSH-1.FM-1': 1.0}", self.read_log())
+
+
+if __name__ == '__main__':
+    unittest.main()
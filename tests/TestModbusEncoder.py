@@ -0,0 +1,36 @@
+import struct
+import unittest
+import modbushandler.modbusencoder as encoder
+import modbushandler.modbusdecoder as decoder
+
+
+class TestModbusEncoder(unittest.TestCase):
+
+    header = {'transaction_id': 40000, 'protocol_id': 0, 'length': 6, 'unit_id': 1, 'function_code': 3}
+
+    def test_respond_read_registers(self):
+        registers = [(1.5, 'FLOAT32'), (7, 'UINT16'), (0xFFF0FFFF, 'UINT32')]
+        response = encoder.respond_read_registers(self.header, registers)
+        self.assertEqual(b'\x9c\x40\x00\x00\x00\x0d\x01\x03\x0a', response[:9])
+        self.assertEqual(struct.pack('>fHI', 1.5, 7, 0xFFF0FFFF), response[9:])
+
+    def test_respond_read_registers_little_endian(self):
+        response = encoder.respond_read_registers(self.header, [(2.0, 'FLOAT32')], 'LITTLE')
+        self.assertEqual(struct.pack('<HHHBBBf', 40000, 0, 7, 1, 3, 4, 2.0), response)
+
+    def test_respond_write_registers(self):
+        header = dict(self.header, function_code=16)
+        response = encoder.respond_write_registers(header, 60000, 4)
+        self.assertEqual(b'\x9c\x40\x00\x00\x00\x06\x01\x10\xea\x60\x00\x04', response)
+
+    '''
+        The decoder reads in place, so it can be handed a memoryview over a larger receive buffer
+    '''
+    def test_decode_memoryview(self):
+        frame = memoryview(bytearray(b'\x00\x05\x00\x00\x00\x0b\x01\x10\x07\xe0\x00\x02\x04\x00\x01\x00\x02\xff'))
+        header = decoder.dissect_header(frame[:7])
+        self.assertEqual(5, header['transaction_id'])
+        self.assertEqual(11, decoder.header_length(frame))
+        is_error, body = decoder.write_multiple_holding_registers(frame[7:17])
+        self.assertFalse(is_error)
+        self.assertEqual({'address': 2016, 'values': [1, 2], 'count': 2}, body)
@@ -0,0 +1,73 @@
+import unittest
+from modbushandler.modbusframer import ModbusTcpFramer
+
+
+class FakeConnection:
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, buffer):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class TestModbusFramer(unittest.TestCase):
+
+    read_request = b'\x00\x01\x00\x00\x00\x06\x01\x03\x00\x00\x00\x02'
+    write_request = b'\x00\x02\x00\x00\x00\x06\x01\x06\x07\xe1\x00\x01'
+
+    def test_single_frame(self):
+        framer = ModbusTcpFramer()
+        framer.feed(self.read_request)
+        frames = list(framer.frames())
+        self.assertEqual([(self.read_request[:7], self.read_request[7:])], frames)
+
+    '''
+        Several pipelined requests in one read all come out, in order
+    '''
+    def test_pipelined_frames(self):
+        framer = ModbusTcpFramer()
+        framer.feed(self.read_request + self.write_request + self.read_request)
+        pdus = [pdu for _, pdu in framer.frames()]
+        self.assertListEqual([self.read_request[7:], self.write_request[7:], self.read_request[7:]], pdus)
+
+    '''
+        A request split over several reads is only handed out once it is complete
+    '''
+    def test_partial_frame(self):
+        framer = ModbusTcpFramer()
+        connection = FakeConnection([self.read_request[:3], self.read_request[3:9], self.read_request[9:]])
+        framer.recv_from(connection)
+        self.assertListEqual([], list(framer.frames()))
+        framer.recv_from(connection)
+        self.assertListEqual([], list(framer.frames()))
+        framer.recv_from(connection)
+        self.assertListEqual([self.read_request[7:]], [pdu for _, pdu in framer.frames()])
+        self.assertEqual(0, framer.recv_from(connection))
+
+    '''
+        Frames that straddle the end of the buffer are moved to the front instead of growing the buffer
+    '''
+    def test_buffer_wraps(self):
+        framer = ModbusTcpFramer(buffer_size=32)
+        stream = (self.read_request + self.write_request) * 10
+        pdus = []
+        for i in range(0, len(stream), 5):
+            framer.feed(stream[i:i + 5])
+            pdus.extend(bytes(pdu) for _, pdu in framer.frames())
+        self.assertEqual(20, len(pdus))
+        self.assertEqual(self.write_request[7:], pdus[-1])
+
+    def test_zero_length_header(self):
+        framer = ModbusTcpFramer()
+        framer.feed(b'\x00\x01\x00\x00\x00\x00\x00')
+        self.assertListEqual([(b'\x00\x01\x00\x00\x00\x00\x00', b'')], list(framer.frames()))
+
+    def test_invalid_length(self):
+        framer = ModbusTcpFramer()
+        framer.feed(b'\x00\x01\x00\x00\xff\xff\x00')
+        self.assertRaises(ValueError, list, framer.frames())
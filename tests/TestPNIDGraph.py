@@ -0,0 +1,63 @@
+import unittest
+from metecmodel.graph import PNIDGraph, CompactPNIDGraph
+
+
+class TestPNIDGraph(unittest.TestCase):
+
+    graph_class = PNIDGraph
+
+    '''
+        GSH.VOL-0 -- EV-1 -- VOL-1 -> FM-1 -> VOL-2 -- EV-2 -- VOL-3      VOL-4 -- EV-3 -- VOL-5
+    '''
+    def make_graph(self):
+        graph = self.graph_class()
+        graph.add_node('GSH.VOL-0', ['GSH.EV-1'])
+        graph.add_node('GSH.EV-1', ['GSH.VOL-0', 'GSH.VOL-1'])
+        graph.add_node('GSH.FM-1', ['GSH.VOL-1', 'GSH.VOL-2'])
+        graph.add_node('GSH.EV-2', ['GSH.VOL-2', 'GSH.VOL-3'])
+        graph.add_node('GSH.EV-3', ['GSH.VOL-4', 'GSH.VOL-5'])
+        return graph
+
+    def test_reachable_from(self):
+        graph = self.make_graph()
+        self.assertEqual({'GSH.VOL-0', 'GSH.EV-1', 'GSH.VOL-1', 'GSH.FM-1', 'GSH.VOL-2', 'GSH.EV-2', 'GSH.VOL-3'},
+                         graph.reachable_from('GSH.VOL-0'))
+        # flow meters are one way
+        self.assertEqual({'GSH.FM-1', 'GSH.VOL-2', 'GSH.EV-2', 'GSH.VOL-3'}, graph.reachable_from('GSH.FM-1'))
+        self.assertEqual(set(), graph.reachable_from('GSH.VOL-9'))
+
+    def test_are_connected(self):
+        graph = self.make_graph()
+        self.assertTrue(graph.are_connected('GSH.VOL-0', 'GSH.VOL-3'))
+        self.assertFalse(graph.are_connected('GSH.VOL-3', 'GSH.VOL-0'))
+        self.assertTrue(graph.are_connected('GSH.VOL-0', 'GSH.VOL-0'))
+        self.assertFalse(graph.are_connected('GSH.VOL-0', 'GSH.VOL-9'))
+
+    def test_redraw_edges(self):
+        graph = self.make_graph()
+        self.assertTrue(graph.are_connected('GSH.VOL-0', 'GSH.VOL-3'))
+        # closing EV-2 leaves it connected to VOL-2 only
+        graph.redraw_edges('GSH.EV-2', ['GSH.VOL-2'])
+        self.assertFalse(graph.are_connected('GSH.VOL-0', 'GSH.VOL-3'))
+        graph.redraw_edges('GSH.EV-2', ['GSH.VOL-2', 'GSH.VOL-3'])
+        self.assertTrue(graph.are_connected('GSH.VOL-0', 'GSH.VOL-3'))
+        # sources that do not reach the flipped valve keep their index
+        reachable = graph.reachable_from('GSH.EV-3')
+        graph.redraw_edges('GSH.EV-2', ['GSH.VOL-2'])
+        self.assertIs(reachable, graph.reachable_from('GSH.EV-3'))
+
+    def test_edges(self):
+        graph = self.make_graph()
+        self.assertEqual([('GSH.FM-1', 'GSH.VOL-2')], graph.edges('GSH.FM-1'))
+        self.assertEqual({('GSH.EV-1', 'GSH.VOL-0'), ('GSH.EV-1', 'GSH.VOL-1')}, set(graph.edges('GSH.EV-1')))
+        self.assertEqual([], graph.edges('GSH.VOL-9'))
+        self.assertEqual(10, graph.number_of_nodes())
+
+
+class TestCompactPNIDGraph(TestPNIDGraph):
+
+    graph_class = CompactPNIDGraph
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import threading
+import time
+from metecmodel.rwlock import ReadWriteLock
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def test_readers_share(self):
+        lock = ReadWriteLock()
+        inside = []
+        barrier = threading.Barrier(3, timeout=5)
+
+        def reader():
+            with lock.read():
+                inside.append(1)
+                # every reader has to be inside at once to get past the barrier
+                barrier.wait()
+
+        threads = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, len(inside))
+
+    def test_writer_exclusive(self):
+        lock = ReadWriteLock()
+        events = []
+
+        def writer():
+            with lock.write():
+                events.append('write')
+
+        with lock.read():
+            thread = threading.Thread(target=writer)
+            thread.start()
+            time.sleep(0.1)
+            events.append('read done')
+        thread.join()
+        self.assertEqual(['read done', 'write'], events)
+
+    def test_reentrant(self):
+        lock = ReadWriteLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                with self.assertRaises(RuntimeError):
+                    lock.acquire_write()
+        # everything was released
+        with lock.write():
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
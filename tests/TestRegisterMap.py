@@ -0,0 +1,53 @@
+import unittest
+from labjackemulator import RegisterMap, ReaderSensors
+
+
+class TestRegisterMap(unittest.TestCase):
+
+    pins_file = '../Resources/pins_to_registers.csv'
+    sensors_file = '../Resources/sensor_properties.csv'
+
+    def test_loaded_once(self):
+        self.assertIs(RegisterMap.load(self.pins_file), RegisterMap.load(self.pins_file))
+        self.assertIs(ReaderSensors.get(self.sensors_file, 'CB-1W.LJ-1'),
+                      ReaderSensors.get(self.sensors_file, 'CB-1W.LJ-1'))
+
+    def test_lookups(self):
+        register_map = RegisterMap.load(self.pins_file)
+        self.assertEqual('AIN0', register_map.get(0).pin)
+        self.assertEqual('FLOAT32', register_map.get(0).data_type)
+        self.assertEqual('CIO0', register_map.get(2016).pin)
+        self.assertEqual(2, register_map.pin_registers[register_map.next_pins['AIN0']])
+        self.assertIsNone(register_map.get(1))
+        self.assertEqual(23, len(register_map.dio_pins))
+
+    '''
+        Next pins on DIO lines are converted to their FIO/EIO/CIO/MIO names, others are kept
+    '''
+    def test_next_pins(self):
+        register_map = RegisterMap.load(self.pins_file)
+        self.assertEqual('FIO0', register_map.next_pins['LED_STATUS'])
+        self.assertEqual('FIO1', register_map.next_pins['DIO0_EF_READ_A'])
+        self.assertEqual('EIO0', register_map.next_pins['DIO7_EF_READ_A'])
+        self.assertIsNone(RegisterMap.DIO_to_ALT('DIO_STATE'))
+        for next_pin in register_map.next_pins.values():
+            self.assertIn(next_pin, register_map.pin_registers)
+
+    def test_slots(self):
+        register_map = RegisterMap.load(self.pins_file)
+        slots = sorted(info.slot for info in register_map.registers.values())
+        self.assertEqual(list(range(len(register_map))), slots)
+
+    def test_read_only(self):
+        register_map = RegisterMap.load(self.pins_file)
+        with self.assertRaises(TypeError):
+            register_map.registers[1] = register_map.get(0)
+
+    def test_sensors_by_reader(self):
+        sensors = ReaderSensors.get(self.sensors_file, 'CB-1S.LJ-1')
+        self.assertIn(('CB-1S.EV-14', 'CIO0'), sensors)
+        self.assertEqual((), ReaderSensors.get(self.sensors_file, 'not a reader'))
+
+
+if __name__ == '__main__':
+    unittest.main()
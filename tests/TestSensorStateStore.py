@@ -0,0 +1,52 @@
+import unittest
+from metecmodel.sensorstatestore import SensorStateStore
+from metecmodel.components import PressureTransducer, Thermocouple, FlowMeter
+
+
+class TestSensorStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SensorStateStore(capacity=2)
+        self.pt1 = PressureTransducer('CB-1W.PT-1', ['VOL-1'], {'slope': '2', 'offset': '10'}, initial_pressure=50,
+                                      store=self.store, group='GSH-1')
+        self.pt2 = PressureTransducer('CB-1W.PT-2', ['VOL-1'], {}, initial_pressure=50,
+                                      store=self.store, group='GSH-1')
+        self.pt3 = PressureTransducer('CB-2W.PT-1', ['VOL-2'], {}, initial_pressure=30,
+                                      store=self.store, group='GSH-2')
+        self.tc = Thermocouple('CB-1W.TC-1', ['VOL-1'], {}, initial_temp=75, store=self.store, group='GSH-1')
+        self.fm = FlowMeter('CB-1W.FM-1', ['VOL-1', 'VOL-2'], {}, initial_flow=0, store=self.store, group='GSH-1')
+
+    def test_components_are_views(self):
+        self.assertEqual(5, self.store.size)
+        self.pt1.pressure = 60
+        self.assertEqual(60, self.store.pressure[self.pt1.sid])
+        self.assertEqual(60, self.pt1.get_reading())
+        self.assertEqual(25, self.pt1.get_reading_voltage())
+        self.assertEqual('random', self.pt1.failure_type)
+        self.assertEqual(0, self.pt1.failure_rate)
+
+    '''
+        Only the sensors of the given kind in the given group change
+    '''
+    def test_set_group_value(self):
+        self.store.set_group_value('GSH-1', SensorStateStore.PRESSURE, 80)
+        self.assertEqual(80, self.pt1.pressure)
+        self.assertEqual(80, self.pt2.pressure)
+        self.assertEqual(30, self.pt3.pressure)
+        self.assertEqual(75, self.tc.temperature)
+        self.store.set_group_value('GSH-1', SensorStateStore.TEMPERATURE, 90)
+        self.assertEqual(90, self.tc.temperature)
+        self.store.set_group_value('GSH-3', SensorStateStore.PRESSURE, 10)
+        self.assertEqual(30, self.pt3.pressure)
+
+    def test_own_store(self):
+        pt = PressureTransducer('CB-1W.PT-1', ['VOL-1'], {}, initial_pressure=40, failure_rate=0.5,
+                                failure_type='dead')
+        self.assertEqual(1, pt.store.size)
+        self.assertEqual(40, pt.get_reading())
+        self.assertEqual(0.5, pt.failure_rate)
+        self.assertEqual('dead', pt.failure_type)
+
+
+if __name__ == '__main__':
+    unittest.main()
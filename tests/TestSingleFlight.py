@@ -0,0 +1,41 @@
+import unittest
+import threading
+import time
+from metecmodel.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    '''
+        Callers arriving while the first one is computing share its result
+    '''
+    def test_coalesce(self):
+        flights = SingleFlight()
+        calls = []
+        results = []
+
+        def compute(value):
+            calls.append(value)
+            time.sleep(0.2)
+            return value * 2
+
+        threads = [threading.Thread(target=lambda: results.append(flights.do('GSH-1', compute, 21)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([21], calls)
+        self.assertEqual([42] * 5, results)
+        self.assertEqual(0, flights.in_flight())
+
+    def test_error_shared(self):
+        flights = SingleFlight()
+        with self.assertRaises(KeyError):
+            flights.do('GSH-1', {}.__getitem__, 'missing')
+        self.assertEqual(0, flights.in_flight())
+        self.assertEqual(3, flights.do('GSH-1', len, 'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import threading
+import unittest
+from metecmodel import StatisticsCollector, LatencyHistogram
+
+
+class TestStatisticsCollector(unittest.TestCase):
+
+    def setUp(self):
+        StatisticsCollector.reset()
+
+    '''
+        Counts of every thread are merged, including threads that are done
+    '''
+    def test_merged_across_threads(self):
+        def count():
+            for _ in range(1000):
+                StatisticsCollector.increment_packets_received()
+                StatisticsCollector.increment_responses_sent()
+                StatisticsCollector.increment_avg_response(0.002)
+
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        StatisticsCollector.increment_packets_received()
+        stats = StatisticsCollector.get_stats()
+        self.assertEqual(8001, stats['packets_received'])
+        self.assertEqual(8000, stats['responses_sent'])
+        self.assertAlmostEqual(0.002, stats['average_response_time'])
+        self.assertEqual(8000, stats['latency']['all']['count'])
+        # shards of finished threads are folded into one
+        self.assertEqual(1, len(StatisticsCollector._shards))
+        self.assertEqual(8001, StatisticsCollector.get_packets_received())
+
+    '''
+        Threads that keep running count in a fresh shard after a reset, their old shard is left alone
+    '''
+    def test_reset_while_counting(self):
+        counted = threading.Event()
+        reset = threading.Event()
+        shards = []
+
+        def count():
+            StatisticsCollector.increment_packets_received()
+            shards.append(StatisticsCollector._get_shard())
+            counted.set()
+            reset.wait()
+            StatisticsCollector.increment_packets_received()
+            StatisticsCollector.increment_packets_received()
+            shards.append(StatisticsCollector._get_shard())
+
+        thread = threading.Thread(target=count)
+        thread.start()
+        counted.wait()
+        self.assertEqual(1, StatisticsCollector.get_packets_received())
+        StatisticsCollector.reset()
+        self.assertEqual(0, StatisticsCollector.get_packets_received())
+        reset.set()
+        thread.join()
+        self.assertEqual(2, StatisticsCollector.get_packets_received())
+        self.assertIsNot(shards[0], shards[1])
+        self.assertEqual(1, shards[0].packets_received)
+
+    def test_socket_errors(self):
+        StatisticsCollector.increment_socket_errors()
+        StatisticsCollector.increment_error_packets_sent()
+        StatisticsCollector.increment_error_packets_sent()
+        stats = StatisticsCollector.get_stats()
+        self.assertEqual(1, stats['socket_errors'])
+        self.assertEqual(2, stats['error_packets_sent'])
+
+    def test_latency_by_port_and_function_code(self):
+        for i in range(1, 1001):
+            StatisticsCollector.increment_avg_response(i / 1000000, 501, 3)
+        StatisticsCollector.increment_avg_response(0.5, 502, 16)
+        latency = StatisticsCollector.get_stats()['latency']
+        self.assertEqual(1001, latency['all']['count'])
+        self.assertEqual(500, latency['all']['max_ms'])
+        port = latency['ports'][501]
+        self.assertEqual(1000, port['count'])
+        self.assertAlmostEqual(0.5, port['p50_ms'], delta=0.5 / 64)
+        self.assertAlmostEqual(0.99, port['p99_ms'], delta=0.99 / 64)
+        self.assertEqual(1, port['max_ms'])
+        self.assertEqual(1, latency['function_codes'][16]['count'])
+        self.assertEqual(500, latency['function_codes'][16]['p999_ms'])
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    '''
+        Every value falls in its bucket and buckets are at most 1/64 of their values wide
+    '''
+    def test_buckets(self):
+        for value in list(range(5000)) + [12345, 999999, 10 ** 9 + 7]:
+            index = LatencyHistogram.bucket_index(value)
+            low = LatencyHistogram.bucket_value(index - 1) + 1 if index else 0
+            high = LatencyHistogram.bucket_value(index)
+            self.assertTrue(low <= value <= high)
+            self.assertLessEqual(high - low, max(1, value / 64))
+
+    def test_merge(self):
+        a = LatencyHistogram()
+        b = LatencyHistogram()
+        for i in range(100):
+            a.record(0.001)
+            b.record(0.010)
+        a.merge(b)
+        self.assertEqual(200, a.count)
+        self.assertAlmostEqual(0.001, a.get_percentile(0.5), delta=0.001 / 64)
+        self.assertAlmostEqual(0.010, a.get_percentile(0.9), delta=0.010 / 64)
+        self.assertEqual(0, LatencyHistogram().get_percentile(0.99))
+
+
+if __name__ == '__main__':
+    unittest.main()
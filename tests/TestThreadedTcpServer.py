@@ -0,0 +1,159 @@
+import socket
+import struct
+import threading
+import time
+import unittest
+from modbushandler import ModbusReceiver
+from metecmodel import StatisticsCollector
+from modbushandler.timerwheel import TimerWheel
+import modbushandler.modbusencoder as encoder
+
+
+class TestThreadedTcpServer(unittest.TestCase):
+
+    def setUp(self):
+        self.barrier = None
+        self.padding = b''
+        self.handled = 0
+        self.clients = []
+
+    def start(self, **kwargs):
+        self.receiver = ModbusReceiver(0, **kwargs)
+        self.thread = threading.Thread(target=self.receiver.start_server, args=(self.handler,))
+        self.thread.start()
+        self.assertTrue(self.receiver.started.wait(5))
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.receiver.stop_server()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+    '''
+        Answers read requests with the requested address
+    '''
+    def handler(self, request):
+        if self.barrier:
+            self.barrier.wait(5)
+        self.handled = self.handled + 1
+        return encoder.respond_read_registers(request['header'], [(request['body']['address'], 'UINT16')]) + \
+            self.padding
+
+    def connect(self) -> socket.socket:
+        client = socket.create_connection(('localhost', self.receiver.port), timeout=5)
+        self.clients.append(client)
+        return client
+
+    @staticmethod
+    def request(transaction_id, address) -> bytes:
+        return struct.pack('>HHHBBHH', transaction_id, 0, 6, 1, 3, address, 1)
+
+    @staticmethod
+    def read_response(client) -> (int, int):
+        response = b''
+        while len(response) < 11:
+            data = client.recv(11 - len(response))
+            if not data:
+                raise ConnectionError('connection closed')
+            response = response + data
+        return struct.unpack('>H', response[:2])[0], struct.unpack('>H', response[9:])[0]
+
+    '''
+        Both requests are in the handler at the same time, one client can't hold up another
+    '''
+    def test_concurrent_clients(self):
+        self.start()
+        self.barrier = threading.Barrier(2)
+        first, second = self.connect(), self.connect()
+        first.sendall(self.request(1, 100))
+        second.sendall(self.request(2, 200))
+        self.assertEqual((1, 100), self.read_response(first))
+        self.assertEqual((2, 200), self.read_response(second))
+        self.barrier = None
+        first.sendall(self.request(3, 300))
+        self.assertEqual((3, 300), self.read_response(first))
+
+    def test_max_connections(self):
+        self.start(max_connections=2)
+        first, second = self.connect(), self.connect()
+        for i, client in enumerate([first, second]):
+            client.sendall(self.request(i, i))
+            self.assertEqual((i, i), self.read_response(client))
+        third = self.connect()
+        try:
+            third.sendall(self.request(3, 3))
+            self.assertEqual(b'', third.recv(11))
+        except ConnectionError:
+            pass
+        # a closed connection makes room for a new one
+        first.close()
+        deadline = time.monotonic() + 5
+        while len(self.receiver._connections) > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        fourth = self.connect()
+        fourth.sendall(self.request(4, 4))
+        self.assertEqual((4, 4), self.read_response(fourth))
+
+    def test_idle_timeout(self):
+        self.start(idle_timeout=0.2)
+        client = self.connect()
+        client.sendall(self.request(1, 1))
+        self.assertEqual((1, 1), self.read_response(client))
+        start = time.monotonic()
+        self.assertEqual(b'', client.recv(11))
+        self.assertLess(time.monotonic() - start, 2)
+        deadline = time.monotonic() + 5
+        while self.receiver._connections and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(0, len(self.receiver._connections))
+
+    '''
+        Delayed responses to a client that never reads fill up the socket buffers, the timer wheel
+        keeps firing other timers in the meantime
+    '''
+    def test_delayed_responses_to_client_that_never_reads(self):
+        wheel = TimerWheel()
+        # cleanups run after tearDown closed the connection
+        self.addCleanup(wheel.stop)
+        self.start(timer_wheel=wheel)
+        self.receiver.get_failure_action = lambda: (True, 0.01)
+        self.padding = bytes(1 << 20)
+        client = self.connect()
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.sendall(b''.join(self.request(i, i) for i in range(32)))
+        deadline = time.monotonic() + 5
+        while (self.handled < 32 or wheel.pending()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(32, self.handled)
+        self.assertEqual(0, wheel.pending())
+        fired = threading.Event()
+        wheel.schedule(0.01, fired.set)
+        self.assertTrue(fired.wait(2))
+
+    '''
+        Error responses of the decoder are counted under the function code of their request
+    '''
+    def test_error_response_latency(self):
+        StatisticsCollector.reset()
+        self.start(device_function_codes=[3])
+        client = self.connect()
+        client.sendall(struct.pack('>HHHBBHH', 1, 0, 6, 1, 5, 0, 0xFF00))
+        deadline = time.monotonic() + 5
+        while StatisticsCollector.get_responses_sent() < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, StatisticsCollector.get_error_packets_sent())
+        self.assertEqual({5: 1}, {code: summary['count'] for code, summary in
+                                  StatisticsCollector.get_latencies()['function_codes'].items()})
+        other = self.connect()
+        other.sendall(self.request(2, 7))
+        self.assertEqual((2, 7), self.read_response(other))
+        deadline = time.monotonic() + 5
+        while StatisticsCollector.get_responses_sent() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual({3: 1, 5: 1}, {code: summary['count'] for code, summary in
+                                        StatisticsCollector.get_latencies()['function_codes'].items()})
+
+
+if __name__ == '__main__':
+    unittest.main()
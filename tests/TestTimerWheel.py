@@ -0,0 +1,54 @@
+import unittest
+import threading
+import time
+from modbushandler.timerwheel import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(tick=0.01, slots=8)
+
+    def tearDown(self):
+        self.wheel.stop()
+
+    def test_fires_in_deadline_order(self):
+        fired = []
+        done = threading.Event()
+        start = time.monotonic()
+        self.wheel.schedule(0.05, fired.append, 'late')
+        self.wheel.schedule(0.01, fired.append, 'early')
+        self.wheel.schedule(0.06, done.set)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(['early', 'late'], fired)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(0, self.wheel.pending())
+
+    '''
+        Delays longer than a turn of the wheel wait for their own turn
+    '''
+    def test_wraps_around(self):
+        fired = threading.Event()
+        start = time.monotonic()
+        self.wheel.schedule(0.2, fired.set)
+        self.assertTrue(fired.wait(2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_cancel(self):
+        fired = []
+        done = threading.Event()
+        timer = self.wheel.schedule(0.02, fired.append, 'cancelled')
+        self.wheel.schedule(0.03, done.set)
+        timer.cancel()
+        self.assertTrue(done.wait(2))
+        self.assertEqual([], fired)
+
+    def test_failing_callback(self):
+        done = threading.Event()
+        self.wheel.schedule(0.01, lambda: 1 / 0)
+        self.wheel.schedule(0.02, done.set)
+        self.assertTrue(done.wait(2))
+
+
+if __name__ == '__main__':
+    unittest.main()